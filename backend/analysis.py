@@ -1,56 +1,230 @@
-import time
-from typing import Dict, Any
-from rules import detect_clauses, apply_rules, extract_entities
-from llm import explain_clause  # LLM integration
+import contextvars, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from models import Clause
+from rules import (
+    detect_clauses, iter_clauses, rule_signals, score_signals, extract_entities, extract_entities_batch, NER_BATCH,
+)
+from llm import explain_clause, concurrency as llm_concurrency  # LLM integration
+from llm import build_messages, compact_summary, prompt_tokens, MAX_COMPLETION_TOKENS
+from providers import get_provider
+from tokens import cost_usd
+from library import suggest_alternative
+from profiling import stage
+from deadline import Deadline, for_options as deadline_for
+import tenants
 
-DEFAULT_BUDGET_SEC = 15
-MAX_LLM_CLAUSES = 20  # slightly higher since we now want all clauses, adjust if needed
+# Both off by default, so every clause gets a note as before; operators opt in.
+# At most this many LLM calls per analysis, riskiest first (0 = no cap)
+MAX_LLM_CLAUSES = int(os.getenv("LLM_MAX_CLAUSES", "0"))
+# Clauses whose heuristic risk is at or below this skip the LLM (-1 disables the gate)
+DEFAULT_LLM_MIN_RISK = int(os.getenv("LLM_MIN_RISK", "-1"))
+SUMMARY_CHARS = 700
+LARGE_CLAUSE_CHARS = 4000  # what the LLM prompt uses anyway; keeps large results bounded
 
 def bucketize(s: int) -> str:
     if s <= 3: return "Low"
     if s <= 6: return "Medium"
     return "High"
 
-def _short_summary(text: str, chars: int = 700) -> str:
+def _short_summary(text: str, chars: int = SUMMARY_CHARS) -> str:
     t = " ".join(text.split())
     return t[:chars]
 
-def analyze_contract(text: str, options: Dict[str, Any]) -> Dict[str, Any]:
-    start = time.time()
-    budget = int(options.get("time_budget_sec", DEFAULT_BUDGET_SEC))
+def analyze_contract(text: str, options: Dict[str, Any],
+                     on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+                     tenant: Optional["tenants.Tenant"] = None,
+                     deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    """Score every clause and, within the time budget, add LLM notes.
+
+    LLM calls are made in order of heuristic risk (highest first) so a tight
+    budget is spent on the clauses that matter; clauses at or below
+    ``llm_min_risk`` are never sent.
+
+    ``on_event`` (used by ``/analyze/stream``) receives a ``clause`` event per
+    scored clause and ``llm`` events as each note streams in.
+
+    With a ``tenant``, each LLM call is charged to its token quota and waits
+    its turn in the fair queue; calls over quota are skipped (``quota``).
+
+    ``deadline`` is the request's (see deadline.py; by default it starts now,
+    from ``time_budget_sec``): NER is skipped for clauses scored once only its
+    reserve is left, LLM calls once it is nearly spent. The result's
+    ``deadline`` entry says whether it was met and what was skipped.
+    """
+    deadline = deadline or deadline_for(options)
     lang = options.get("lang", "English")
 
-    clauses = detect_clauses(text)
+    with stage("detect_clauses"):
+        clauses = detect_clauses(text)
     contract_summary = _short_summary(text)
 
-    out = []
-    for cl in clauses:
-        # Heuristic rules
-        score, hits = apply_rules(cl)
-        cl.risk, cl.rule_hits = score, hits
+    out = [_score_clause(cl, options, lang, on_event, deadline=deadline) for cl in clauses]
+    return _complete(out, contract_summary, options, on_event, tenant, deadline)
 
-        clause_dict = cl.model_dump()
-        clause_dict["entities"] = extract_entities(cl.text)
+def analyze_pages(pages: Iterable[str], options: Dict[str, Any],
+                  on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+                  tenant: Optional["tenants.Tenant"] = None,
+                  deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    """Large-document mode of analyze_contract over a page stream (see
+    ingest.iter_pages, which stops reading at the same ``deadline``). Clauses
+    are segmented across page breaks, then scored and NER-tagged in batches as
+    pages arrive, so the whole text is never held at once; stored clause text
+    is cut to LARGE_CLAUSE_CHARS once scored."""
+    deadline = deadline or deadline_for(options)
+    lang = options.get("lang", "English")
+    head: List[str] = []  # first pages, for the LLM contract summary
 
-        # --- Always call LLM if enabled ---
-        if options.get("use_llm"):
-            remaining = budget - (time.time() - start)
-            if remaining <= 3:
-                break  # stop if close to time budget
-            per_timeout = max(6, int(min(18, remaining - 1)))
-            clause_dict["llm"] = explain_clause(
-                clause_text=cl.text,
-                title=cl.title,
-                lang=lang,
-                summary=contract_summary,
-                timeout_sec=per_timeout
-            )
-
-        out.append(clause_dict)
-
-        # Respect budget
-        if time.time() - start > budget:
+    def timed(pages):
+        it = iter(pages)
+        while True:
+            with stage("extract_text"):
+                page = next(it, None)
+            if page is None:
+                return
+            if sum(map(len, head)) < SUMMARY_CHARS:
+                head.append(page)
+            yield page
+
+    out: List[Dict[str, Any]] = []
+    clauses = iter_clauses(timed(pages))
+    while True:
+        # page extraction inside this pull is timed by timed(); segmentation itself is cheap
+        batch = list(islice(clauses, NER_BATCH))
+        if not batch:
             break
+        if deadline.in_reserve():
+            deadline.skip("entities", len(batch))
+            entities = [[] for _ in batch]
+        else:
+            with stage("extract_entities"):
+                entities = extract_entities_batch([cl.text for cl in batch])
+        for cl, ents in zip(batch, entities):
+            out.append(_score_clause(cl, options, lang, on_event, entities=ents, max_text=LARGE_CLAUSE_CHARS))
+
+    return _complete(out, _short_summary("".join(head)), options, on_event, tenant, deadline)
+
+def _score_clause(cl: Clause, options: Dict[str, Any], lang: str, on_event=None,
+                  entities: Optional[List[str]] = None, max_text: Optional[int] = None,
+                  deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    # Heuristic rules
+    with stage("apply_rules"):
+        hits, dampen = rule_signals(cl)
+        cl.risk, cl.rule_hits, cl.dampen = score_signals(hits, dampen), hits, dampen
+
+    clause_dict = cl.model_dump()
+    if entities is None and deadline is not None and deadline.in_reserve():
+        deadline.skip("entities")
+        entities = []
+    elif entities is None:
+        with stage("extract_entities"):
+            entities = extract_entities(cl.text)
+    clause_dict["entities"] = entities
+
+    # --- Approved clause library: the alternative wording; the LLM (if on) still reviews the clause ---
+    if options.get("use_library", True):
+        with stage("clause_library"):
+            note = suggest_alternative(cl.title, cl.text, hits, lang=lang)
+        if note:
+            clause_dict["llm"] = note
+    if max_text is not None and len(cl.text) > max_text:
+        clause_dict["text"] = cl.text[:max_text]
+        clause_dict["text_truncated"] = True
+    if on_event:
+        on_event({"event": "clause", "clause": dict(clause_dict)})
+    return clause_dict
+
+def _complete(out: List[Dict[str, Any]], contract_summary: str, options: Dict[str, Any],
+              on_event, tenant: Optional["tenants.Tenant"], deadline: Deadline) -> Dict[str, Any]:
+    """LLM pass over scored clauses, then the contract-level aggregates."""
+    lang = options.get("lang", "English")
+
+    # --- LLM pass: highest heuristic risk first, output stays in document order ---
+    llm_stats = {"called": 0, "gated": 0, "over_budget": 0, "over_quota": 0, "over_token_budget": 0}
+    spend = None
+    if options.get("use_llm"):
+        contract_summary = compact_summary(contract_summary)  # once, shared by every call
+        provider = get_provider()
+        spend = _LLMSpend(options.get("max_llm_tokens"), options.get("max_llm_cost_usd"),
+                          provider.model if provider else None)
+        min_risk = int(options.get("llm_min_risk", DEFAULT_LLM_MIN_RISK))
+        pending = [c for c in out if "llm" not in c or c["llm"].get("source") == "library"]
+        queue = []
+        for c in sorted(pending, key=lambda c: c["risk"], reverse=True):  # stable: ties keep doc order
+            if c["risk"] <= min_risk:
+                c["llm_skipped"] = "below_threshold"
+            elif MAX_LLM_CLAUSES and len(queue) >= MAX_LLM_CLAUSES:
+                c["llm_skipped"] = "budget"
+            else:
+                queue.append(c)
+
+        def explain(c: Dict[str, Any]):
+            # the deadline is checked when a provider slot frees up, not at submit time
+            remaining = deadline.remaining()
+            if remaining <= 3:
+                c["llm_skipped"] = "budget"
+                return
+            # riskiest clauses reserve first, so a token/cost ceiling drops the least risky ones
+            prompt = prompt_tokens(build_messages(c["text"], c["title"], lang, contract_summary))
+            if not spend.reserve(prompt):
+                c["llm_skipped"] = "token_budget"
+                return
+            on_partial = None
+            if on_event:
+                on_partial = lambda n, cid=c["id"]: on_event({"event": "llm", "id": cid, "llm": n, "partial": True})
+            cost, charged = prompt + MAX_COMPLETION_TOKENS, []
+
+            @contextmanager
+            def admit():
+                # entered only if this call goes to the provider, not when it joins an identical one;
+                # read the deadline again, since a joined call that was dropped has used up time
+                with _llm_slot(c, tenant, cost, deadline.remaining()) as left:
+                    if left is not None:
+                        charged.append(cost)
+                    yield None if left is None else min(18, left - 1)
+
+            note = None
+            try:
+                with stage("llm_wait"):
+                    note = explain_clause(
+                        clause_text=c["text"],
+                        title=c["title"],
+                        lang=lang,
+                        summary=contract_summary,
+                        timeout_sec=int(min(18, remaining - 1)),  # remaining > 3 here
+                        on_partial=on_partial,
+                        admit=admit,
+                    )
+            finally:
+                spend.settle(prompt, (note or {}).get("usage"))
+                if charged:
+                    _settle_tenant(tenant, cost, note)
+            if note is None:
+                return  # dropped by quota or the fair queue; llm_skipped is set
+            c["llm"] = _with_library(note, c.get("llm"))
+            if on_event:
+                on_event({"event": "llm", "id": c["id"], "llm": c["llm"],
+                          "partial": bool(c["llm"].get("partial"))})
+
+        if queue:
+            # executor threads pick up work in submission (= risk) order
+            with ThreadPoolExecutor(max_workers=min(llm_concurrency(), len(queue))) as pool:
+                # each task runs in a copy of the caller's context so stage timers reach its profile
+                futures = [pool.submit(contextvars.copy_context().run, explain, c) for c in queue]
+                for f in futures:
+                    f.result()
+
+        llm_stats["called"] = sum(1 for c in queue if "llm" in c and c["llm"].get("source") != "library")
+        llm_stats["gated"] = sum(1 for c in pending if c.get("llm_skipped") == "below_threshold")
+        llm_stats["over_budget"] = sum(1 for c in pending if c.get("llm_skipped") == "budget")
+        # clauses past MAX_LLM_CLAUSES never entered the queue; the rest ran out of time
+        late = sum(1 for c in queue if c.get("llm_skipped") == "budget")
+        if late:
+            deadline.skip("llm", late)
+        llm_stats["over_quota"] = sum(1 for c in pending if c.get("llm_skipped") == "quota")
+        llm_stats["over_token_budget"] = sum(1 for c in pending if c.get("llm_skipped") == "token_budget")
 
     # Top risks (score >= 5)
     top = [
@@ -67,10 +241,115 @@ def analyze_contract(text: str, options: Dict[str, Any]) -> Dict[str, Any]:
     c3 = all_scores[2] if len(all_scores) > 2 else 0
     overall = int(round(0.6 * a + 0.3 * b + 0.1 * c3))
 
-    return {
+    res = {
         "overall_score": overall,
         "bucket": bucketize(overall),
-        "duration_ms": int((time.time() - start) * 1000),
+        "duration_ms": int(deadline.elapsed() * 1000),
         "top_risks": top,
         "clauses": out,
+        "llm_stats": llm_stats,
+        "deadline": deadline.report(),
     }
+    if spend is not None:
+        res["llm_usage"] = spend.totals()
+    if llm_stats["over_quota"]:
+        res["degraded"] = {"reason": "llm_quota", "tenant": tenant.name,
+                           "retry_after_sec": tenant.llm_tokens.retry_after(MAX_COMPLETION_TOKENS)}
+    return res
+
+class _LLMSpend:
+    """Per-request token/cost ceiling (``max_llm_tokens`` / ``max_llm_cost_usd``)
+    shared by the LLM worker threads. A call reserves its prompt tokens plus
+    the completion cap before it starts and settles to the measured usage."""
+
+    def __init__(self, max_tokens: Optional[int], max_cost: Optional[float], model: Optional[str]):
+        self.max_tokens = int(max_tokens) if max_tokens else None
+        self.max_cost = float(max_cost) if max_cost else None
+        self.model = model
+        self.prompt = self.completion = self.calls = 0
+        self.cost = 0.0
+        self._held_tokens, self._held_cost = 0, 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, prompt: int) -> bool:
+        cost = cost_usd(self.model, prompt, MAX_COMPLETION_TOKENS)
+        with self._lock:
+            spent = self.prompt + self.completion + self._held_tokens
+            if self.max_tokens is not None and spent + prompt + MAX_COMPLETION_TOKENS > self.max_tokens:
+                return False
+            if self.max_cost is not None and self.cost + self._held_cost + cost > self.max_cost:
+                return False
+            self._held_tokens += prompt + MAX_COMPLETION_TOKENS
+            self._held_cost += cost
+            return True
+
+    def settle(self, prompt: int, usage: Optional[Dict[str, Any]]):
+        with self._lock:
+            self._held_tokens -= prompt + MAX_COMPLETION_TOKENS
+            self._held_cost -= cost_usd(self.model, prompt, MAX_COMPLETION_TOKENS)
+            if usage and not usage.get("coalesced"):
+                self.prompt += usage.get("prompt_tokens", 0)
+                self.completion += usage.get("completion_tokens", 0)
+                self.cost += usage.get("cost_usd", 0.0)
+                self.calls += 1
+
+    def totals(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt,
+            "completion_tokens": self.completion,
+            "total_tokens": self.prompt + self.completion,
+            "cost_usd": round(self.cost, 6),
+            "max_tokens": self.max_tokens,
+            "max_cost_usd": self.max_cost,
+        }
+
+def _with_library(note: Dict[str, Any], library: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """LLM review of a clause that also matched the clause library: the
+    explanation, issue and risk are the LLM's, the alternative wording the
+    approved one."""
+    if not library:
+        return note
+    return {**note, "alt_clause": library.get("alt_clause") or note.get("alt_clause"),
+            "library_id": library.get("library_id"), "library_version": library.get("library_version"),
+            "match_score": library.get("match_score")}
+
+@contextmanager
+def _llm_slot(c: Dict[str, Any], tenant: Optional["tenants.Tenant"], cost: int, remaining: float):
+    """Charge one LLM call (``cost`` tokens, worst case) to ``tenant`` and hold
+    its fair-queue slot; yields the seconds left once the call may start, or
+    None (``llm_skipped`` set). _settle_tenant trues the charge up afterwards."""
+    if remaining <= 3:
+        c["llm_skipped"] = "budget"
+        yield None
+        return
+    if tenant is None:
+        yield remaining
+        return
+    if not tenant.take_llm(cost):
+        c["llm_skipped"] = "quota"
+        yield None
+        return
+    t0 = time.time()
+    with tenants.llm_queue().slot(tenant, cost, timeout=remaining - 3) as ok:
+        left = remaining - (time.time() - t0)
+        if not ok or left <= 3:
+            tenant.llm_tokens.refund(cost)
+            c["llm_skipped"] = "budget"
+            yield None
+            return
+        yield left
+
+def _settle_tenant(tenant: Optional["tenants.Tenant"], cost: int, note: Optional[Dict[str, Any]]):
+    """True up a call charged by _llm_slot to its measured usage; a call with
+    no usage (provider busy or not configured) is refunded in full."""
+    if tenant is None:
+        return
+    usage = (note or {}).get("usage")
+    if not usage:
+        tenant.llm_tokens.refund(cost)
+        return
+    used = usage.get("total_tokens", cost)
+    tenant.llm_tokens.refund(cost - used)
+    tenant.count("llm_calls")
+    tenant.count("llm_tokens", used)
@@ -0,0 +1,53 @@
+import time
+from typing import Any, Dict, Optional
+
+# ---------- Request deadline ----------
+# One deadline per request, started when the upload arrives and handed to every
+# stage (page extraction, NER, LLM calls). Stages that can be cut short check
+# it between units of work and skip the rest instead of running over, recording
+# what they dropped, so time_budget_sec bounds the whole request, not only the
+# LLM pass. Rules always run: they are cheap and are the result itself.
+DEFAULT_BUDGET_SEC = 15
+# share of the budget held back from reading and scoring for the LLM pass
+LLM_RESERVE_SHARE = 0.4
+# without the LLM, a small tail is still kept for scoring what was already read
+RESERVE_SHARE = 0.1
+
+class Deadline:
+    def __init__(self, budget_sec: float, reserve_sec: float = 0.0):
+        self.budget = float(budget_sec)
+        self.reserve = float(reserve_sec)
+        self.start = time.monotonic()
+        self.started_at = time.time()
+        self.skipped: Dict[str, Optional[int]] = {}
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def remaining(self) -> float:
+        return self.budget - self.elapsed()
+
+    def in_reserve(self) -> bool:
+        """True once only the reserved tail of the budget is left: optional
+        work (more pages, NER) stops here."""
+        return self.remaining() < self.reserve
+
+    def skip(self, what: str, n: Optional[int] = 1):
+        """Record ``n`` units of ``what`` dropped for time; None = an unknown number."""
+        if n is None or self.skipped.get(what, 0) is None:
+            self.skipped[what] = None
+        else:
+            self.skipped[what] = self.skipped.get(what, 0) + n
+
+    def report(self) -> Dict[str, Any]:
+        elapsed = self.elapsed()
+        return {
+            "budget_sec": self.budget,
+            "elapsed_ms": int(elapsed * 1000),
+            "met": elapsed <= self.budget,
+            "skipped": dict(self.skipped),
+        }
+
+def for_options(options: Dict[str, Any]) -> Deadline:
+    budget = float(options.get("time_budget_sec") or DEFAULT_BUDGET_SEC)
+    return Deadline(budget, budget * (LLM_RESERVE_SHARE if options.get("use_llm") else RESERVE_SHARE))
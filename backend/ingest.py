@@ -1,40 +1,368 @@
-from typing import Tuple
+import re
+import zipfile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from io import BytesIO
 import pdfplumber
 from docx import Document
+from lxml import etree
+from deadline import Deadline
 
 PAGE_MARK = "\n\n===PAGE===\n\n"
 RAW_SIZE_CAP = 5_000_000      # ~5 MB
 CHAR_CAP = 60_000             # hard cap to protect runtime
 DEFAULT_MAX_PAGES = 20
 
+# Large-document mode: no page/char caps, pages are yielded one at a time
+LARGE_RAW_SIZE_CAP = 50_000_000
+PSEUDO_PAGE_CHARS = 20_000    # DOCX/TXT have no pages; they are fed in slices this size
+
 def extract_text(file, max_pages: int = DEFAULT_MAX_PAGES, max_chars: int = CHAR_CAP) -> Tuple[str, str]:
-    name = (file.filename or "").lower()
-    raw = file.file.read() or b""
+    return extract_bytes(file.file.read() or b"", file.filename, max_pages, max_chars)
+
+def extract_bytes(raw: bytes, filename: Optional[str], max_pages: int = DEFAULT_MAX_PAGES,
+                  max_chars: int = CHAR_CAP, coverage: Optional[Dict] = None,
+                  deadline: Optional[Deadline] = None) -> Tuple[str, str]:
+    """Same as extract_text for an upload already read into memory. ``coverage``,
+    if given, is filled with how much of the document the returned text covers.
+    PDF pages past the ``deadline`` reserve are skipped."""
+    name = (filename or "").lower()
+    cov = coverage if coverage is not None else {}
+    cov.update(mode="standard", pages_total=None, pages_analyzed=None)
+    cut_bytes = len(raw) > RAW_SIZE_CAP
 
-    if len(raw) > RAW_SIZE_CAP:
+    if cut_bytes:
         raw = raw[:RAW_SIZE_CAP]
 
     if name.endswith(".pdf"):
-        text = _pdf_text(raw, max_pages)
-        return text[:max_chars], "pdf"
-    if name.endswith(".docx"):
-        text = _docx_text(raw)
-        return text[:max_chars], "docx"
-    # txt fallback
-    return raw.decode("utf-8", errors="ignore")[:max_chars], "txt"
-
-def _pdf_text(raw: bytes, max_pages: int) -> str:
+        text, kind = _pdf_text(raw, max_pages, cov, deadline), "pdf"
+        ratio = cov["pages_analyzed"] / cov["pages_total"] if cov["pages_total"] else 1.0
+    elif name.endswith(".docx"):
+        text, kind = _docx_text(raw, max_chars), "docx"
+        ratio = None if len(text) >= max_chars else 1.0  # the reader stops at max_chars; total unknown
+    else:
+        # txt fallback
+        text, kind = raw.decode("utf-8", errors="ignore"), "txt"
+        ratio = 1.0
+
+    if len(text) > max_chars:
+        if ratio is not None:
+            ratio *= max_chars / len(text)
+        text = text[:max_chars]
+    if cut_bytes:
+        ratio = None
+    cov.update(chars_analyzed=len(text), ratio=None if ratio is None else round(ratio, 3), truncated=ratio != 1.0)
+    return text, kind
+
+def _pdf_text(raw: bytes, max_pages: int, coverage: Optional[Dict] = None,
+              deadline: Optional[Deadline] = None) -> str:
     out = []
     with pdfplumber.open(BytesIO(raw)) as pdf:
         pages = min(len(pdf.pages), max_pages)
         for i in range(pages):
+            if i and deadline is not None and deadline.in_reserve():
+                deadline.skip("pages", pages - i)
+                out.pop()  # trailing PAGE_MARK
+                pages = i
+                break
             # pdfplumber returns None on image-only pages (no OCR here by design)
             out.append(pdf.pages[i].extract_text() or "")
             if i < pages - 1:
                 out.append(PAGE_MARK)
+        if coverage is not None:
+            coverage.update(pages_total=len(pdf.pages), pages_analyzed=pages)
     return "\n".join(out).strip()
 
-def _docx_text(raw: bytes) -> str:
-    doc = Document(BytesIO(raw))
-    return "\n".join(p.text for p in doc.paragraphs)
+def iter_pages(raw: bytes, filename: Optional[str], coverage: Optional[Dict] = None,
+               deadline: Optional[Deadline] = None) -> Iterator[str]:
+    """Large-document mode: yield the text page by page (PDF) or in
+    PSEUDO_PAGE_CHARS slices (DOCX/TXT), never holding the whole text.
+    ``coverage`` is kept up to date as pages are consumed. Once the consumer
+    has used up all but the ``deadline`` reserve, no further page is read."""
+    name = (filename or "").lower()
+    cov = coverage if coverage is not None else {}
+    cov.update(mode="large", pages_total=None, pages_analyzed=0, chars_analyzed=0,
+               truncated=len(raw) > LARGE_RAW_SIZE_CAP, ratio=None)
+    raw = raw[:LARGE_RAW_SIZE_CAP]
+
+    if name.endswith(".pdf"):
+        pages = _pdf_pages(raw, cov)
+    elif name.endswith(".docx"):
+        pages = _slices(_docx_stream(raw))
+    else:
+        text = raw.decode("utf-8", errors="ignore")
+        pages = _slices(text[i:i + PSEUDO_PAGE_CHARS] for i in range(0, len(text), PSEUDO_PAGE_CHARS))
+
+    try:
+        for page in pages:
+            cov["pages_analyzed"] += 1
+            cov["chars_analyzed"] += len(page)
+            yield page
+            # checked before reading the next page, i.e. once the consumer has scored this one
+            if deadline is not None and deadline.in_reserve() and _more(pages, cov):
+                total = cov["pages_total"]
+                deadline.skip("pages", total - cov["pages_analyzed"] if total else None)
+                cov["truncated"] = True
+                if total:
+                    cov["ratio"] = round(cov["pages_analyzed"] / total, 3)
+                return
+    finally:
+        pages.close()
+    if not cov["truncated"]:
+        cov["ratio"] = 1.0
+
+def _more(pages: Iterator[str], cov: Dict) -> bool:
+    if cov["pages_total"] is not None:
+        return cov["pages_analyzed"] < cov["pages_total"]
+    return next(pages, None) is not None  # DOCX/TXT slices are cheap to peek at
+
+def _pdf_pages(raw: bytes, cov: Dict) -> Iterator[str]:
+    with pdfplumber.open(BytesIO(raw)) as pdf:
+        cov["pages_total"] = len(pdf.pages)
+        for page in pdf.pages:
+            text = page.extract_text() or ""
+            page.close()  # drop the parsed layout objects; they dominate memory on long PDFs
+            yield text
+
+def _docx_stream(raw: bytes) -> Iterator[str]:
+    try:
+        for line in _docx_lines(raw, max_chars=float("inf")):
+            yield line + "\n"
+    except (zipfile.BadZipFile, KeyError, etree.XMLSyntaxError):
+        yield _docx_text(raw, max_chars=LARGE_RAW_SIZE_CAP)
+
+def _slices(pieces: Iterable[str]) -> Iterator[str]:
+    """Regroup text pieces into pseudo-pages, cutting at line ends where possible."""
+    buf = ""
+    for piece in pieces:
+        buf += piece
+        while len(buf) >= PSEUDO_PAGE_CHARS:
+            cut = buf.rfind("\n", 0, PSEUDO_PAGE_CHARS) + 1 or PSEUDO_PAGE_CHARS
+            yield buf[:cut]
+            buf = buf[cut:]
+    if buf:
+        yield buf
+
+def _docx_text(raw: bytes, max_chars: int = CHAR_CAP) -> str:
+    try:
+        return "\n".join(_docx_lines(raw, max_chars))
+    except (zipfile.BadZipFile, KeyError, etree.XMLSyntaxError):
+        # odd packaging the streaming reader can't handle; python-docx is slower but lenient
+        doc = Document(BytesIO(raw))
+        return "\n".join(p.text for p in doc.paragraphs)
+
+# ---------- Streaming DOCX reader ----------
+# Iterparses the WordprocessingML parts straight from the zip instead of building
+# a python-docx object tree. Emits headers and footers first, then the body
+# (paragraphs and table rows in document order, list numbers rendered as text),
+# and stops as soon as max_chars have been produced. Page furniture goes ahead
+# of the first heading, where clause detection drops it as preamble; after the
+# body it would be read as part of the last clause.
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+P, TBL, TR, TC = W + "p", W + "tbl", W + "tr", W + "tc"
+BODY = W + "body"
+TEXT_TAGS = (W + "t", W + "tab", W + "br", W + "cr")
+
+PART_RE = re.compile(r"^word/(header|footer)\d*\.xml$")
+
+def _docx_lines(raw: bytes, max_chars: int):
+    with zipfile.ZipFile(BytesIO(raw)) as zf:
+        names = zf.namelist()
+        numbering = _Numbering(zf, names)
+        headers = sorted(n for n in names if PART_RE.match(n) and "header" in n)
+        footers = sorted(n for n in names if PART_RE.match(n) and "footer" in n)
+
+        total, seen = 0, set()
+        for part in headers + footers + ["word/document.xml"]:
+            repeated = part != "word/document.xml"
+            with zf.open(part) as f:
+                for line in _part_lines(f, numbering):
+                    if repeated:
+                        # the same header/footer is often attached to every section
+                        if not line.strip() or line in seen:
+                            continue
+                        seen.add(line)
+                    yield line
+                    total += len(line) + 1
+                    if total >= max_chars:
+                        return
+
+def _part_lines(f, numbering: "_Numbering"):
+    tables: List[Dict] = []   # open tables, innermost last
+    fallback = 0              # inside mc:Fallback (duplicate of mc:Choice content)
+    for event, el in etree.iterparse(f, events=("start", "end"), huge_tree=True):
+        tag = el.tag
+        if event == "start":
+            if tag == TBL:
+                tables.append({"row": [], "cell": []})
+            elif tag == TR and tables:
+                tables[-1]["row"] = []
+            elif tag == TC and tables:
+                tables[-1]["cell"] = []
+            elif tag == MC_FALLBACK:
+                fallback += 1
+            continue
+
+        if tag == P:
+            if not fallback:
+                text = numbering.prefix(el) + _run_text(el)
+                if tables:
+                    tables[-1]["cell"].append(text)
+                else:
+                    yield text
+            el.clear(keep_tail=True)
+        elif tag == TC and tables:
+            tables[-1]["row"].append(" ".join(t for t in tables[-1]["cell"] if t.strip()))
+        elif tag == TR and tables:
+            row = tables[-1]["row"]
+            if any(c.strip() for c in row):
+                line = " | ".join(row)
+                if len(tables) > 1:
+                    tables[-2]["cell"].append(line)  # nested table lands in the outer cell
+                else:
+                    yield line
+        elif tag == TBL and tables:
+            tables.pop()
+        elif tag == MC_FALLBACK:
+            fallback -= 1
+
+        # drop finished top-level blocks so memory stays flat on large files
+        parent = el.getparent()
+        if parent is not None and parent.tag == BODY:
+            el.clear(keep_tail=True)
+            while el.getprevious() is not None:
+                del parent[0]
+
+def _run_text(p) -> str:
+    out = []
+    for el in p.iter(*TEXT_TAGS):
+        if el.tag == W + "t":
+            out.append(el.text or "")
+        elif el.tag == W + "tab":
+            out.append("\t")
+        else:
+            out.append("\n")
+    return "".join(out)
+
+# ---------- List numbering ----------
+def _val(el, path: str) -> Optional[str]:
+    found = el.find(path)
+    return found.get(W + "val") if found is not None else None
+
+def _roman(n: int) -> str:
+    out = []
+    for v, s in ((1000, "m"), (900, "cm"), (500, "d"), (400, "cd"), (100, "c"), (90, "xc"),
+                 (50, "l"), (40, "xl"), (10, "x"), (9, "ix"), (5, "v"), (4, "iv"), (1, "i")):
+        while n >= v:
+            out.append(s)
+            n -= v
+    return "".join(out)
+
+def _letter(n: int) -> str:
+    # Word repeats the letter past z: a..z, aa..zz, ...
+    return chr(ord("a") + (n - 1) % 26) * ((n - 1) // 26 + 1) if n > 0 else ""
+
+def _fmt(n: int, fmt: str) -> str:
+    if fmt == "lowerLetter":
+        return _letter(n)
+    if fmt == "upperLetter":
+        return _letter(n).upper()
+    if fmt == "lowerRoman":
+        return _roman(n)
+    if fmt == "upperRoman":
+        return _roman(n).upper()
+    if fmt == "decimalZero":
+        return f"{n:02d}"
+    if fmt == "none":
+        return ""
+    return str(n)
+
+class _Numbering:
+    """Resolves w:numPr (direct or via paragraph style) to rendered list labels."""
+
+    def __init__(self, zf: zipfile.ZipFile, names: List[str]):
+        self.levels: Dict[str, Dict[int, Dict]] = {}    # abstractNumId -> ilvl -> level def
+        self.nums: Dict[str, Tuple[str, Dict[int, int]]] = {}  # numId -> (abstractNumId, start overrides)
+        self.styles: Dict[str, Tuple[Optional[str], Optional[str], Optional[str]]] = {}  # id -> (numId, ilvl, basedOn)
+        self.counters: Dict[str, List[Optional[int]]] = {}
+        if "word/numbering.xml" in names:
+            self._load_numbering(etree.fromstring(zf.read("word/numbering.xml")))
+        if self.nums and "word/styles.xml" in names:
+            self._load_styles(etree.fromstring(zf.read("word/styles.xml")))
+
+    def _load_numbering(self, root):
+        for an in root.iter(W + "abstractNum"):
+            lvls = {}
+            for lvl in an.iter(W + "lvl"):
+                lvls[int(lvl.get(W + "ilvl", "0"))] = {
+                    "start": int(_val(lvl, W + "start") or 1),
+                    "fmt": _val(lvl, W + "numFmt") or "decimal",
+                    "text": _val(lvl, W + "lvlText") or "",
+                }
+            self.levels[an.get(W + "abstractNumId")] = lvls
+        for num in root.iter(W + "num"):
+            overrides = {}
+            for ov in num.iter(W + "lvlOverride"):
+                start = _val(ov, W + "startOverride")
+                if start is not None:
+                    overrides[int(ov.get(W + "ilvl", "0"))] = int(start)
+            self.nums[num.get(W + "numId")] = (_val(num, W + "abstractNumId"), overrides)
+
+    def _load_styles(self, root):
+        for st in root.iter(W + "style"):
+            if st.get(W + "type") != "paragraph":
+                continue
+            self.styles[st.get(W + "styleId")] = (
+                _val(st, f"{W}pPr/{W}numPr/{W}numId"),
+                _val(st, f"{W}pPr/{W}numPr/{W}ilvl"),
+                _val(st, W + "basedOn"),
+            )
+
+    def _style_numpr(self, style_id: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        seen = set()
+        while style_id and style_id in self.styles and style_id not in seen:
+            seen.add(style_id)
+            num_id, ilvl, based = self.styles[style_id]
+            if num_id is not None:
+                return num_id, ilvl
+            style_id = based
+        return None, None
+
+    def prefix(self, p) -> str:
+        if not self.nums:
+            return ""
+        ppr = p.find(W + "pPr")
+        if ppr is None:
+            return ""
+        num_id = _val(ppr, f"{W}numPr/{W}numId")
+        ilvl = _val(ppr, f"{W}numPr/{W}ilvl")
+        if num_id is None:
+            num_id, style_ilvl = self._style_numpr(_val(ppr, W + "pStyle"))
+            ilvl = ilvl or style_ilvl
+        if num_id is None or num_id == "0" or num_id not in self.nums:
+            return ""
+        abstract, overrides = self.nums[num_id]
+        levels = self.levels.get(abstract) or {}
+        lvl = int(ilvl or 0)
+        if lvl not in levels:
+            return ""
+
+        # lists with a start override count on their own; others continue the abstract list
+        key = num_id if overrides else abstract
+        counts = self.counters.setdefault(key, [None] * 9)
+        start = overrides.get(lvl, levels[lvl]["start"])
+        counts[lvl] = start if counts[lvl] is None else counts[lvl] + 1
+        for deeper in range(lvl + 1, len(counts)):
+            counts[deeper] = None
+
+        d = levels[lvl]
+        if d["fmt"] == "bullet":
+            return "• "
+        label = d["text"]
+        for i in range(lvl, -1, -1):
+            ref = levels.get(i)
+            if ref is None:
+                continue
+            n = counts[i] if counts[i] is not None else overrides.get(i, ref["start"])
+            label = label.replace(f"%{i + 1}", _fmt(n, ref["fmt"]))
+        return label + " " if label else ""
@@ -0,0 +1,183 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# ---------- Incremental JSON object parser ----------
+# Consumes an LLM completion chunk by chunk and surfaces top-level fields of the
+# first JSON object as soon as they complete. String values are also exposed
+# while still arriving, so callers can forward partial text and keep whatever
+# has been generated if the stream is cut off.
+
+_WS = " \t\r\n"
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+(
+    BEFORE,      # waiting for the opening "{" (skips prose / code fences)
+    KEY_OR_END,  # expecting a key or "}"
+    KEY,         # inside a key string
+    COLON,
+    VALUE,       # expecting the start of a value
+    STRING,      # inside a string value
+    SCALAR,      # number / true / false / null
+    NESTED,      # array or object value, captured raw
+    AFTER,       # expecting "," or "}"
+    DONE,
+) = range(10)
+
+class IncrementalJSON:
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self._state = BEFORE
+        self._key = ""
+        self._buf: List[str] = []
+        self._esc = False
+        self._uni: Optional[str] = None
+        self._depth = 0
+        self._nested_str = False
+
+    @property
+    def done(self) -> bool:
+        return self._state == DONE
+
+    @property
+    def partial(self) -> Optional[Tuple[str, str]]:
+        """(key, text so far) for a string value that has not closed yet."""
+        if self._state == STRING:
+            return self._key, "".join(self._buf)
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Completed fields plus the in-progress string value, if any."""
+        out = dict(self.fields)
+        p = self.partial
+        if p and p[0] not in out:
+            out[p[0]] = p[1]
+        return out
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume ``chunk``; return the (key, value) pairs completed by it."""
+        done: List[Tuple[str, Any]] = []
+        for ch in chunk or "":
+            st = self._state
+            if st == DONE:
+                break
+            if st == BEFORE:
+                if ch == "{":
+                    self._state = KEY_OR_END
+            elif st == KEY_OR_END:
+                if ch == '"':
+                    self._buf, self._state = [], KEY
+                elif ch == "}":
+                    self._state = DONE
+            elif st in (KEY, STRING):
+                if not self._string_char(ch):
+                    continue
+                text = "".join(self._buf)
+                if st == KEY:
+                    self._key, self._state = text, COLON
+                else:
+                    done.append(self._complete(text))
+            elif st == COLON:
+                if ch == ":":
+                    self._state = VALUE
+            elif st == VALUE:
+                if ch in _WS:
+                    continue
+                self._buf = []
+                if ch == '"':
+                    self._state = STRING
+                elif ch in "[{":
+                    self._buf, self._depth, self._nested_str = [ch], 1, False
+                    self._state = NESTED
+                else:
+                    self._buf, self._state = [ch], SCALAR
+            elif st == SCALAR:
+                if ch in ",}" or ch in _WS:
+                    done.append(self._complete(_scalar("".join(self._buf))))
+                    self._after(ch)
+                else:
+                    self._buf.append(ch)
+            elif st == NESTED:
+                self._buf.append(ch)
+                if self._nested_str:
+                    if self._esc:
+                        self._esc = False
+                    elif ch == "\\":
+                        self._esc = True
+                    elif ch == '"':
+                        self._nested_str = False
+                elif ch == '"':
+                    self._nested_str = True
+                elif ch in "[{":
+                    self._depth += 1
+                elif ch in "]}":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        try:
+                            val = json.loads("".join(self._buf))
+                        except ValueError:
+                            val = None
+                        done.append(self._complete(val))
+            elif st == AFTER:
+                self._after(ch)
+        return done
+
+    def finish(self) -> List[Tuple[str, Any]]:
+        """End of stream: complete a trailing scalar that had no delimiter yet."""
+        if self._state == SCALAR and self._buf:
+            return [self._complete(_scalar("".join(self._buf)))]
+        return []
+
+    # --- internals ---
+    def _string_char(self, ch: str) -> bool:
+        """Append one char of a JSON string; True when the closing quote is seen."""
+        if self._uni is not None:
+            self._uni += ch
+            if len(self._uni) == 4:
+                try:
+                    code = int(self._uni, 16)
+                except ValueError:
+                    code = None
+                self._uni = None
+                if code is None:
+                    return False
+                prev = ord(self._buf[-1]) if self._buf else 0
+                if 0xDC00 <= code <= 0xDFFF and 0xD800 <= prev <= 0xDBFF:
+                    # join a surrogate pair into one code point
+                    self._buf[-1] = chr(0x10000 + ((prev - 0xD800) << 10) + (code - 0xDC00))
+                else:
+                    self._buf.append(chr(code))
+            return False
+        if self._esc:
+            self._esc = False
+            if ch == "u":
+                self._uni = ""
+            else:
+                self._buf.append(_ESCAPES.get(ch, ch))
+            return False
+        if ch == "\\":
+            self._esc = True
+            return False
+        if ch == '"':
+            return True
+        self._buf.append(ch)
+        return False
+
+    def _complete(self, value: Any) -> Tuple[str, Any]:
+        self.fields[self._key] = value
+        self._buf, self._state = [], AFTER
+        return self._key, value
+
+    def _after(self, ch: str):
+        if ch == ",":
+            self._state = KEY_OR_END
+        elif ch == "}":
+            self._state = DONE
+        else:
+            self._state = AFTER
+
+def _scalar(tok: str) -> Any:
+    tok = tok.strip()
+    try:
+        return json.loads(tok)
+    except ValueError:
+        return tok or None
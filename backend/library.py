@@ -0,0 +1,116 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional
+
+# ---------- Clause library ----------
+# Approved fair-terms clauses, keyed by heading and rule hit. The TF-IDF index
+# is built once at import so a flagged clause gets its alternative in ms,
+# without an LLM round-trip.
+LIBRARY_PATH = os.getenv(
+    "CLAUSE_LIBRARY_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "rules", "clauses.json"),
+)
+MIN_SCORE = float(os.getenv("CLAUSE_LIBRARY_MIN_SCORE", "0.3"))
+
+# MIN_SCORE applies to the cosine similarity of the clause text alone. Among
+# entries that clear it, a rule or heading match ranks higher than shared
+# vocabulary; the rule bonus scales with the Jaccard overlap so the entry
+# written for exactly these hits wins.
+RULE_BONUS = 0.35
+HEADING_BONUS = 0.15
+
+TOKEN_RE = re.compile(r"[\w\u0900-\u097F]+")
+
+def _tokens(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall((text or "").lower()) if len(t) > 1]
+
+def _load_library() -> Dict:
+    try:
+        with open(LIBRARY_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f) or {}
+        return {"version": str(data.get("version", "")), "clauses": list(data.get("clauses", []))}
+    except Exception:
+        return {"version": "", "clauses": []}
+
+class ClauseIndex:
+    def __init__(self, entries: List[Dict], version: str = ""):
+        self.version = version
+        self.entries = entries
+        docs = [self._doc_tokens(e) for e in entries]
+        df = Counter(t for d in docs for t in set(d))
+        n = len(docs)
+        self.idf = {t: math.log((1 + n) / (1 + c)) + 1.0 for t, c in df.items()}
+        self.vectors = [self._vectorize(d) for d in docs]
+        self.headings = [{h.lower() for h in e.get("headings", [])} for e in entries]
+        self.rules = [set(e.get("rules", [])) for e in entries]
+
+    @staticmethod
+    def _doc_tokens(e: Dict) -> List[str]:
+        parts = [e.get("text", ""), e.get("note", ""), " ".join(e.get("headings", []))]
+        parts += [r.replace("_", " ") for r in e.get("rules", [])]
+        return _tokens(" ".join(parts))
+
+    def _vectorize(self, toks: List[str]) -> Dict[str, float]:
+        tf = Counter(toks)
+        vec = {t: (1.0 + math.log(c)) * self.idf[t] for t, c in tf.items() if t in self.idf}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {t: v / norm for t, v in vec.items()}
+
+    def search(self, title: str, text: str, hits: List[str], lang: str = "English",
+               min_score: float = 0.0) -> Optional[Dict]:
+        """Best entry whose similarity to ``text`` is at least ``min_score``;
+        ``score`` is that similarity, without the ranking bonuses."""
+        qv = self._vectorize(_tokens(text))
+        head = (title or "").strip().lower()
+        hit_set = set(hits)
+
+        best, best_rank, best_score = None, 0.0, 0.0
+        for i, e in enumerate(self.entries):
+            if e.get("lang", "English") != lang:
+                continue
+            dv = self.vectors[i]
+            score = sum(w * dv.get(t, 0.0) for t, w in qv.items())
+            if score <= 0 or score < min_score:
+                continue
+            rank = score
+            overlap = hit_set & self.rules[i]
+            if overlap:
+                rank += RULE_BONUS * len(overlap) / len(hit_set | self.rules[i])
+            if head in self.headings[i]:
+                rank += HEADING_BONUS
+            if rank > best_rank:
+                best, best_rank, best_score = e, rank, score
+        if best is None:
+            return None
+        return {"entry": best, "score": round(min(1.0, best_score), 3)}
+
+_lib = _load_library()
+INDEX = ClauseIndex(_lib["clauses"], _lib["version"])
+
+def suggest_alternative(title: str, text: str, hits: List[str], lang: str = "English",
+                        min_score: float = MIN_SCORE) -> Optional[Dict]:
+    """Best approved alternative for a flagged clause, shaped like an LLM note.
+
+    Returns None when no entry's text is at least ``min_score`` similar to the
+    clause text. With the LLM on, the clause is still reviewed and only the
+    library's ``alt_clause`` is kept (see analysis._with_library).
+    """
+    if not hits:
+        return None
+    match = INDEX.search(title, text, hits, lang, min_score=min_score)
+    if not match:
+        return None
+    e = match["entry"]
+    return {
+        "explanation": e.get("note") or "",
+        "issue": e.get("issue"),
+        "alt_clause": e.get("text"),
+        "risk_0_10": None,
+        "source": "library",
+        "library_id": e.get("id"),
+        "library_version": INDEX.version,
+        "match_score": match["score"],
+    }
@@ -1,21 +1,10 @@
-import os, json
-from typing import Dict, Optional
-from dotenv import load_dotenv
-from groq import Groq
-
-# Load variables from .env
-load_dotenv()
-
-# --- Groq setup ---
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
-_groq_client = None
-
-def _get_groq():
-    global _groq_client
-    if _groq_client is None:
-        _groq_client = Groq(api_key=GROQ_API_KEY)
-    return _groq_client
+import hashlib, json, os, time
+from contextlib import closing
+from typing import Callable, ContextManager, Dict, List, Optional
+from jsonstream import IncrementalJSON
+from providers import Provider, get_provider
+from singleflight import SingleFlight
+from tokens import chat_tokens, cost_usd, count_tokens, truncate_tokens
 
 # --- Prompts ---
 SYSTEM_PROMPT = (
@@ -31,45 +20,148 @@ SYSTEM_PROMPT = (
     "}\n"
 )
 
-USER_TEMPLATE = (
-    "Language: {lang}\n"
+# Per-request context goes after the fixed instructions in the system message,
+# so every call of one analysis starts with an identical prefix (provider-side
+# prompt caching) and the summary is compacted once, not per clause.
+CONTEXT_TEMPLATE = (
+    "\nLanguage: {lang}\n"
     "Contract summary (short): {summary}\n"
+)
+
+USER_TEMPLATE = (
     "Clause title: {title}\n"
     "Clause text:\n{clause}\n\n"
     "Return ONLY the JSON. No prose outside JSON."
 )
 
+# Token limits (cut on sentence boundaries, see tokens.truncate_tokens)
+CLAUSE_TOKENS = int(os.getenv("LLM_CLAUSE_TOKENS", "1000"))
+SUMMARY_TOKENS = int(os.getenv("LLM_SUMMARY_TOKENS", "150"))
+MAX_COMPLETION_TOKENS = int(os.getenv("LLM_MAX_COMPLETION_TOKENS", "600"))
+
+_flights = SingleFlight()
+
+# --- Prompt building ---
+def compact_summary(summary: str) -> str:
+    """Contract summary within SUMMARY_TOKENS; callers do this once per contract."""
+    return truncate_tokens(" ".join((summary or "").split()), SUMMARY_TOKENS)
+
+def build_messages(clause_text: str, title: str, lang: str = "English", summary: str = "") -> List[Dict]:
+    """``summary`` goes in as given: pass it through compact_summary first."""
+    system = SYSTEM_PROMPT + CONTEXT_TEMPLATE.format(lang=lang, summary=summary)
+    content = USER_TEMPLATE.format(title=title or "Clause", clause=truncate_tokens(clause_text, CLAUSE_TOKENS))
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": content},
+    ]
+
+def prompt_tokens(messages: List[Dict]) -> int:
+    return chat_tokens(messages)
+
 # --- Main function ---
 def explain_clause(clause_text: str, title: str, lang: str = "English",
-                   summary: str = "", timeout_sec: int = 18) -> Dict:
-    if not GROQ_API_KEY:
+                   summary: str = "", timeout_sec: int = 18,
+                   on_partial: Optional[Callable[[Dict], None]] = None,
+                   provider: Optional[Provider] = None,
+                   admit: Optional[Callable[[], ContextManager[Optional[float]]]] = None) -> Optional[Dict]:
+    """Explain one clause, streaming the completion.
+
+    Fields are parsed as they arrive; ``on_partial`` receives the note built so
+    far after every chunk that changes it. If ``timeout_sec`` elapses mid-stream
+    the fields received so far are returned with ``partial=True``. A call made
+    while an identical one is in flight waits for and returns a copy of its
+    note (without partial callbacks).
+
+    ``admit`` (quota charge, fair-queue slot) is entered only by the call that
+    goes to the provider, not by callers joining it; it yields the seconds the
+    call may take, or None to drop it, in which case None is returned.
+    """
+    provider = provider or get_provider()
+    if provider is None:
         return _missing_key()
 
-    content = USER_TEMPLATE.format(
-        lang=lang,
-        summary=(summary or "")[:600],
-        title=title or "Clause",
-        clause=clause_text[:4000],
-    )
+    messages = build_messages(clause_text, title, lang, summary)
 
+    # concurrent identical reviews (double submits, repeated boilerplate) share one call
+    prompt = "\0".join(m["content"] for m in messages)
+    key = (provider.name, provider.model, hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+
+    def lead() -> Optional[Dict]:
+        if admit is None:
+            return _stream_note(provider, messages, timeout_sec, on_partial)
+        with admit() as left:
+            if left is None:
+                return None
+            return _stream_note(provider, messages, min(timeout_sec, left), on_partial)
+
+    t0 = time.monotonic()
     try:
-        client = _get_groq()
-        resp = client.chat.completions.create(
-            model=GROQ_MODEL,
-            temperature=0.2,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": content},
-            ],
-        )
-        txt = resp.choices[0].message.content
-        return _parse_response(txt)
+        note, shared = _flights.do(key, lead, timeout=timeout_sec)
+    except TimeoutError:
+        return _error("timed out waiting for an identical clause review")
+    if shared and note is None:
+        # the call joined was dropped by its own caller's quota or queue; try under ours
+        timeout_sec -= time.monotonic() - t0  # lead() reads it
+        if timeout_sec <= 0:
+            return _error("timed out waiting for an identical clause review")
+        note, shared = lead(), False
+    if note is None:
+        return None
+    if shared:
+        # the tokens were spent (and accounted) by the call that was joined
+        return {**note, "usage": {**note.get("usage", {}), "coalesced": True}}
+    return note
+
+def _stream_note(provider: Provider, messages, timeout_sec: int,
+                 on_partial: Optional[Callable[[Dict], None]]) -> Dict:
+    raw: List[str] = []
+    try:
+        note = _read_stream(provider, messages, timeout_sec, on_partial, raw)
     except Exception as e:
+        # failed before any output (no slot, refused, rate-limited, ...): no usage, nothing to charge
         return _error(str(e))
+    p, c = prompt_tokens(messages), count_tokens("".join(raw))
+    note["usage"] = {"prompt_tokens": p, "completion_tokens": c, "total_tokens": p + c,
+                     "cost_usd": cost_usd(provider.model, p, c)}
+    return note
+
+def _read_stream(provider: Provider, messages, timeout_sec: int,
+                 on_partial: Optional[Callable[[Dict], None]], raw: List[str]) -> Dict:
+    deadline = time.monotonic() + timeout_sec
+    parser = IncrementalJSON()
+    try:
+        with closing(provider.stream_chat(messages, timeout=timeout_sec,
+                                          max_tokens=MAX_COMPLETION_TOKENS)) as deltas:
+            for delta in deltas:
+                raw.append(delta)
+                parser.feed(delta)
+                if on_partial:
+                    on_partial(_note_from(parser.snapshot()))
+                if parser.done:
+                    break
+                if time.monotonic() > deadline:
+                    return _partial_note(parser)
+    except Exception as e:
+        if not raw:
+            raise  # _stream_note reports it without usage
+        if parser.snapshot():
+            return _partial_note(parser)
+        return _error(str(e))
+
+    if not parser.done and parser.snapshot():
+        # stream ended before the closing brace: keep what arrived, flagged as such
+        return _partial_note(parser)
+    parser.finish()
+    if not parser.fields:
+        # model wrapped or mangled the JSON; fall back to a whole-text parse
+        return _parse_response("".join(raw))
+    return _note_from(parser.fields)
 
 # --- Helpers ---
 def _parse_response(txt: str) -> Dict:
-    data = _safe_json(txt)
+    return _note_from(_safe_json(txt))
+
+def _note_from(data: Dict) -> Dict:
     return {
         "explanation": data.get("explanation") or "",
         "issue": data.get("issue"),
@@ -77,6 +169,12 @@ def _parse_response(txt: str) -> Dict:
         "risk_0_10": _safe_int(data.get("risk_0_10")),
     }
 
+def _partial_note(parser: IncrementalJSON) -> Dict:
+    parser.finish()
+    note = _note_from(parser.snapshot())
+    note["partial"] = True
+    return note
+
 def _safe_json(s: str) -> Dict:
     if not s:
         return {}
@@ -99,7 +197,7 @@ def _safe_int(x: Optional[int]) -> Optional[int]:
 
 def _missing_key() -> Dict:
     return {
-        "explanation": "⚠️ No Groq API key found. Showing heuristic results only.",
+        "explanation": "⚠️ No LLM provider configured (set GROQ_API_KEY or LLM_PROVIDER). Showing heuristic results only.",
         "issue": None,
         "alt_clause": None,
         "risk_0_10": None,
@@ -112,3 +210,8 @@ def _error(msg: str) -> Dict:
         "alt_clause": None,
         "risk_0_10": None,
     }
+
+def concurrency() -> int:
+    """How many explain_clause calls the configured provider accepts at once."""
+    provider = get_provider()
+    return provider.max_concurrency if provider else 1
@@ -0,0 +1,386 @@
+"""
+Load-test the analysis API and find where /analyze saturates.
+
+    cd backend
+    python loadtest.py run --workers 2 --llm-latency-ms 800 --out load.json
+    python loadtest.py run --target http://localhost:8000 --corpus ./contracts
+    python loadtest.py stub-server --port 9100 --latency-ms 500
+
+``run`` starts an OpenAI-compatible stub LLM server and a uvicorn backend
+pointed at it (unless --target is given), replays a mixed PDF/DOCX/TXT corpus
+with LLM on/off at increasing concurrency, and reports throughput, latency
+percentiles, errors, quota-degraded responses and per-worker CPU/RSS for
+every step plus the knee. The local backend runs with TENANT_QUOTAS=0, and
+each request is made unique so coalescing does not inflate throughput;
+responses that were still coalesced are counted per step.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from providers import stub_completion
+
+# ---------- Stub LLM server ----------
+def stub_app(latency_ms: int):
+    """OpenAI-compatible /v1/chat/completions that answers after ``latency_ms``."""
+    from fastapi import FastAPI
+    from fastapi.responses import StreamingResponse
+
+    app = FastAPI(title="Stub LLM")
+
+    @app.post("/v1/chat/completions")
+    async def completions(payload: dict):
+        prompt = (payload.get("messages") or [{}])[-1].get("content", "")
+        body = stub_completion(prompt)
+        created, model = int(time.time()), payload.get("model", "stub")
+
+        if not payload.get("stream"):
+            await asyncio.sleep(latency_ms / 1000)
+            return {
+                "id": "stub", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": body}}],
+            }
+
+        pieces = [body[i:i + 16] for i in range(0, len(body), 16)]
+
+        async def sse():
+            for p in pieces:
+                await asyncio.sleep(latency_ms / 1000 / len(pieces))
+                chunk = {"id": "stub", "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": p}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(sse(), media_type="text/event-stream")
+
+    return app
+
+# ---------- Corpus ----------
+CLAUSE_TEMPLATES = [
+    ("Payment", "The Client shall pay all invoices within {days} days of receipt. No late fee applies."),
+    ("Indemnity", "The Vendor shall indemnify the Client without limit against all losses and claims."),
+    ("Limitation of Liability", "The Vendor shall have no liability for indirect losses. Liability is capped at fees paid."),
+    ("Termination", "The Client may terminate for convenience with a notice period {notice} days."),
+    ("Confidentiality", "Confidential information shall be kept secret on a perpetual basis by the recipient."),
+    ("Governing Law", "This Agreement is governed by the laws of {place} and subject to its jurisdiction."),
+    ("Force Majeure", "Neither party is liable for delay caused by events beyond its reasonable control."),
+    ("Services", "The Vendor shall provide the services described in Schedule A with reasonable skill and care."),
+]
+
+def _contract_text(rng: random.Random, clauses: int) -> str:
+    parts = []
+    for i in range(clauses):
+        title, body = CLAUSE_TEMPLATES[i % len(CLAUSE_TEMPLATES)]
+        body = body.format(days=rng.choice([30, 45, 60, 90]), notice=rng.choice([7, 15, 30]),
+                           place=rng.choice(["India", "Delaware", "Singapore"]))
+        parts.append(f"{i + 1}. {title}\n{body} " + "Further terms apply as agreed. " * rng.randint(2, 12))
+    return "\n\n".join(parts)
+
+def _to_docx(text: str) -> bytes:
+    from docx import Document
+    doc = Document()
+    for para in text.split("\n"):
+        doc.add_paragraph(para)
+    buf = BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+def _to_pdf(text: str) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, SimpleDocTemplate
+    buf = BytesIO()
+    style = getSampleStyleSheet()["BodyText"]
+    SimpleDocTemplate(buf, pagesize=A4).build([Paragraph(p, style) for p in text.split("\n") if p.strip()])
+    return buf.getvalue()
+
+def synth_corpus(n: int, seed: int = 7) -> List[Tuple[str, bytes]]:
+    """``n`` synthetic contracts, rotating TXT / DOCX / PDF, 4-30 clauses each."""
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        text = _contract_text(rng, rng.randint(4, 30))
+        kind = ("txt", "docx", "pdf")[i % 3]
+        data = text.encode("utf-8") if kind == "txt" else (_to_docx(text) if kind == "docx" else _to_pdf(text))
+        out.append((f"contract_{i}.{kind}", data))
+    return out
+
+def load_corpus(path: str) -> List[Tuple[str, bytes]]:
+    out = []
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith((".pdf", ".docx", ".txt")):
+            with open(os.path.join(path, name), "rb") as f:
+                out.append((name, f.read()))
+    return out
+
+# ---------- Process stats (Linux /proc) ----------
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def _proc_stat(pid: int) -> Optional[Tuple[int, float, int]]:
+    """(ppid, cpu seconds, rss bytes) or None when /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return int(fields[1]), (int(fields[11]) + int(fields[12])) / CLK_TCK, int(fields[21]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+def _process_tree(root: int) -> List[int]:
+    if not os.path.isdir("/proc"):
+        return []
+    parents: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            st = _proc_stat(int(entry))
+            if st:
+                parents.setdefault(st[0], []).append(int(entry))
+    out, todo = [], [root]
+    while todo:
+        pid = todo.pop()
+        out.append(pid)
+        todo += parents.get(pid, [])
+    return out
+
+class ProcSampler:
+    """Samples CPU% and RSS of the backend process tree while a step runs."""
+
+    def __init__(self, root_pid: Optional[int], interval: float = 0.5):
+        self.root, self.interval = root_pid, interval
+        self.samples: Dict[int, List[Tuple[float, float, int]]] = {}
+        self._task = None
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            for pid in _process_tree(self.root):
+                st = _proc_stat(pid)
+                if st:
+                    self.samples.setdefault(pid, []).append((now, st[1], st[2]))
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.samples = {}
+        if self.root:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> List[Dict]:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        out = []
+        for pid, s in sorted(self.samples.items()):
+            if len(s) < 2:
+                continue
+            cpu = (s[-1][1] - s[0][1]) / max(1e-6, s[-1][0] - s[0][0]) * 100
+            out.append({"pid": pid, "cpu_pct": round(cpu, 1), "rss_mb": round(max(x[2] for x in s) / 2**20, 1)})
+        return out
+
+# ---------- Load steps ----------
+def _pct(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))]
+
+async def run_step(client: httpx.AsyncClient, target: str, corpus, concurrency: int, seconds: float,
+                   llm_ratio: float, budget: int, rng: random.Random, unique: bool = True) -> Dict:
+    latencies: List[float] = []
+    errors, sent, degraded, coalesced, shared_llm = 0, 0, 0, 0, 0
+    stop_at = time.monotonic() + seconds
+
+    async def worker():
+        nonlocal errors, sent, degraded, coalesced, shared_llm
+        while time.monotonic() < stop_at:
+            name, data = corpus[rng.randrange(len(corpus))]
+            opts = {"use_llm": rng.random() < llm_ratio, "time_budget_sec": budget, "store": False}
+            if unique:
+                # a corpus file is re-sent many times; a per-request option keeps the
+                # server from coalescing it with an identical upload still in flight
+                opts["metadata"] = {"loadtest_seq": sent}
+            t0 = time.monotonic()
+            sent += 1
+            try:
+                r = await client.post(f"{target}/analyze", files={"file": (name, data)},
+                                      data={"options": json.dumps(opts)})
+                if r.status_code != 200:
+                    errors += 1
+                else:
+                    res = r.json()
+                    if res.get("degraded"):
+                        degraded += 1  # a tenant quota cut the work short; not comparable throughput
+                        continue
+                    latencies.append(time.monotonic() - t0)
+                    coalesced += bool(res.get("coalesced"))
+                    # clause reviews answered by an identical call from another request
+                    shared_llm += sum(1 for c in res.get("clauses", [])
+                                      if ((c.get("llm") or {}).get("usage") or {}).get("coalesced"))
+            except httpx.HTTPError:
+                errors += 1
+
+    t0 = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.monotonic() - t0
+    return {
+        "concurrency": concurrency,
+        "requests": sent,
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "error_rate": round(errors / sent, 3) if sent else 0.0,
+        "degraded_rate": round(degraded / sent, 3) if sent else 0.0,
+        "coalesced": coalesced,
+        "shared_llm_calls": shared_llm,
+        "p50_ms": round(_pct(latencies, 50) * 1000),
+        "p90_ms": round(_pct(latencies, 90) * 1000),
+        "p99_ms": round(_pct(latencies, 99) * 1000),
+    }
+
+def find_knee(steps: List[Dict]) -> Optional[Dict]:
+    """Step with the best throughput/latency ratio ("power"): past it, extra
+    concurrency mostly buys queueing delay rather than throughput."""
+    ok = [s for s in steps if s["p50_ms"] > 0 and s["error_rate"] < 0.05 and s["degraded_rate"] < 0.05]
+    if not ok:
+        return None
+    return max(ok, key=lambda s: s["throughput_rps"] / s["p50_ms"])
+
+# ---------- Orchestration ----------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_ready(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.3)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def _spawn(args: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(args, env={**os.environ, **env}, cwd=os.path.dirname(os.path.abspath(__file__)),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+async def _ramp(args, target: str, corpus, backend_pid: Optional[int]) -> Dict:
+    rng = random.Random(args.seed)
+    levels, c = [], 1
+    while c <= args.max_concurrency:
+        levels.append(c)
+        c *= 2
+    limits = httpx.Limits(max_connections=args.max_concurrency, max_keepalive_connections=args.max_concurrency)
+    steps = []
+    async with httpx.AsyncClient(limits=limits, timeout=args.request_timeout) as client:
+        sampler = ProcSampler(backend_pid)
+        for level in levels:
+            sampler.start()
+            step = await run_step(client, target, corpus, level, args.step_seconds, args.llm_ratio,
+                                  args.time_budget, rng, unique=not args.allow_coalescing)
+            step["workers"] = await sampler.stop()
+            steps.append(step)
+            _print_step(step)
+            # past collapse there is nothing more to learn
+            if step["error_rate"] > 0.2:
+                break
+    knee = find_knee(steps)
+    return {"target": target, "corpus": len(corpus), "steps": steps,
+            "knee_concurrency": knee["concurrency"] if knee else None}
+
+def _print_step(s: Dict):
+    workers = ", ".join(f"{w['pid']}:{w['cpu_pct']}%/{w['rss_mb']}MB" for w in s["workers"]) or "-"
+    print(f"c={s['concurrency']:<4} rps={s['throughput_rps']:<7} p50={s['p50_ms']:<6} p90={s['p90_ms']:<6} "
+          f"p99={s['p99_ms']:<6} err={s['error_rate']:<6} degraded={s['degraded_rate']:<6} "
+          f"coalesced={s['coalesced']}/{s['shared_llm_calls']} workers[{workers}]", flush=True)
+
+def cmd_run(args):
+    corpus = load_corpus(args.corpus) if args.corpus else synth_corpus(args.corpus_size)
+    if not corpus:
+        sys.exit("empty corpus")
+    procs: List[subprocess.Popen] = []
+    backend_pid = None
+    try:
+        target = args.target
+        if not target:
+            stub_port, api_port = _free_port(), _free_port()
+            procs.append(_spawn([sys.executable, __file__, "stub-server", "--port", str(stub_port),
+                                 "--latency-ms", str(args.llm_latency_ms)], {}))
+            _wait_ready(f"http://127.0.0.1:{stub_port}/docs")
+            db = os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "portfolio.db")
+            # every load request comes from one tenant; its quotas would cap the run, not the server
+            env = {"LLM_PROVIDER": "openai", "LLM_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+                   "LLM_MODEL": "stub", "PORTFOLIO_DB": db, "TENANT_QUOTAS": "0"}
+            if args.llm_concurrency:
+                env["LLM_MAX_CONCURRENCY"] = str(args.llm_concurrency)
+            api = _spawn([sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port),
+                          "--workers", str(args.workers), "--log-level", "warning"], env)
+            procs.append(api)
+            backend_pid = api.pid
+            target = f"http://127.0.0.1:{api_port}"
+            _wait_ready(f"{target}/health")
+        report = asyncio.run(_ramp(args, target, corpus, backend_pid))
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+    print(f"knee: concurrency={report['knee_concurrency']}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+def cmd_stub(args):
+    import uvicorn
+    uvicorn.run(stub_app(args.latency_ms), host="127.0.0.1", port=args.port, log_level="warning")
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    run = sub.add_parser("run", help="ramp load against the API and report saturation")
+    run.add_argument("--target", help="existing backend URL (default: start one locally)")
+    run.add_argument("--workers", type=int, default=1, help="uvicorn workers for the local backend")
+    run.add_argument("--corpus", help="directory of .pdf/.docx/.txt files (default: synthetic)")
+    run.add_argument("--corpus-size", type=int, default=30)
+    run.add_argument("--max-concurrency", type=int, default=32)
+    run.add_argument("--step-seconds", type=float, default=15)
+    run.add_argument("--llm-ratio", type=float, default=0.5, help="share of requests with use_llm")
+    run.add_argument("--llm-latency-ms", type=int, default=800, help="stub LLM latency per call")
+    run.add_argument("--llm-concurrency", type=int, help="LLM_MAX_CONCURRENCY for the local backend")
+    run.add_argument("--time-budget", type=int, default=15, help="time_budget_sec sent with each request")
+    run.add_argument("--request-timeout", type=float, default=120)
+    run.add_argument("--allow-coalescing", action="store_true",
+                     help="send repeated files as-is, so duplicates in flight may be coalesced")
+    run.add_argument("--seed", type=int, default=7)
+    run.add_argument("--out", help="write the JSON report here")
+    run.set_defaults(func=cmd_run)
+
+    stub = sub.add_parser("stub-server", help="run only the stub LLM server")
+    stub.add_argument("--port", type=int, default=9100)
+    stub.add_argument("--latency-ms", type=int, default=800)
+    stub.set_defaults(func=cmd_stub)
+
+    args = ap.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,18 @@
 # path: backend/main.py
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, PlainTextResponse
-from ingest import extract_text
-from analysis import analyze_contract
+from fastapi.responses import StreamingResponse, PlainTextResponse, FileResponse
+from fastapi.concurrency import run_in_threadpool
+from ingest import extract_bytes, iter_pages
+from analysis import analyze_contract, analyze_pages
+from portfolio import get_store, content_hash, ContentHasher
+import portfolio
+import profiling
+import tenants
+from profiling import stage
+import whatif
+from singleflight import AsyncSingleFlight, EventLog
+from deadline import Deadline, for_options as deadline_for
 from io import BytesIO
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import (
@@ -13,9 +22,12 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from html import escape
 from datetime import datetime
-import json, time
+from collections import OrderedDict
+from typing import List, Optional
+import hashlib, json, logging, os, threading, time, uuid
 
 app = FastAPI(title="Legal Assistant API")
+logger = logging.getLogger("legal_assistant")
 
 # CORS
 app.add_middleware(
@@ -29,30 +41,268 @@ app.add_middleware(
 def health():
     return {"status": "ok"}
 
-@app.post("/analyze")
-async def analyze(file: UploadFile = File(...), options: str = Form("{}")):
-    t0 = time.time()
+def _parse_options(options: str) -> dict:
     try:
-        opts = json.loads(options or "{}")
+        return json.loads(options or "{}")
     except Exception:
-        opts = {}
-
-    max_pages = int(opts.get("max_pages", 20))
-    text, _ = extract_text(file, max_pages=max_pages, max_chars=60_000)
-
-    if not text.strip():
-        return {
-            "overall_score": 0,
-            "bucket": "Low",
-            "duration_ms": int((time.time() - t0) * 1000),
-            "top_risks": [],
-            "clauses": [],
-        }
-
-    res = analyze_contract(text, opts)
-    res["duration_ms"] = int((time.time() - t0) * 1000)
+        return {}
+
+def _empty_result(t0: float) -> dict:
+    return {
+        "overall_score": 0,
+        "bucket": "Low",
+        "duration_ms": int((time.time() - t0) * 1000),
+        "top_risks": [],
+        "clauses": [],
+    }
+
+# ---------- Recent results (exports by reference) ----------
+# The frontend asks for reports by analysis_id instead of posting the whole
+# result back; older entries are evicted, callers then fall back to POST.
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+_results: "OrderedDict[str, dict]" = OrderedDict()
+_results_lock = threading.Lock()
+
+def _remember(res: dict):
+    res["analysis_id"] = uuid.uuid4().hex
+    with _results_lock:
+        _results[res["analysis_id"]] = res
+        while len(_results) > RESULT_CACHE_SIZE:
+            _results.popitem(last=False)
+
+def _recall(analysis_id: str) -> Optional[dict]:
+    with _results_lock:
+        return _results.get(analysis_id)
+
+def _admit(opts: dict, api_key: Optional[str], tenant_header: Optional[str]):
+    """Resolve the caller's tenant; over its request quota the LLM pass is dropped."""
+    tenant = tenants.resolve(api_key, tenant_header)
+    degraded = None
+    if not tenant.take_request() and opts.get("use_llm"):
+        opts["use_llm"] = False
+        degraded = {"reason": "request_quota", "tenant": tenant.name,
+                    "retry_after_sec": tenant.requests.retry_after()}
+    return tenant, degraded
+
+def _finish(res: dict, tenant: "tenants.Tenant", degraded: Optional[dict]):
+    if degraded:
+        res["degraded"] = degraded
+    if res.get("degraded"):
+        tenant.count("degraded")
+
+def _record(res: dict, digest: str, filename: str, opts: dict):
+    """Append the result to the portfolio store unless the caller opted out."""
+    if not (portfolio.ENABLED and opts.get("store", True)):
+        return
+    try:
+        res["contract_id"] = get_store().append(res, digest, filename, opts.get("metadata"))
+    except Exception as e:
+        # analytics must never fail an analysis, but a store that stopped taking writes must show
+        logger.exception("portfolio store rejected %s", filename)
+        res["contract_id"] = None
+        res["store_error"] = f"{type(e).__name__}: {e}"
+
+# ---------- Analysis (identical in-flight uploads are coalesced) ----------
+_flights = AsyncSingleFlight()
+_streams: "dict[str, EventLog]" = {}
+_streams_lock = threading.Lock()
+
+def _flight_key(raw: bytes, filename: Optional[str], opts: dict, tenant: "tenants.Tenant") -> str:
+    """Same bytes, parser, effective options and tenant => same result."""
+    ext = os.path.splitext((filename or "").lower())[1]
+    return "|".join([hashlib.sha256(raw).hexdigest(), ext, tenant.name, json.dumps(opts, sort_keys=True, default=str)])
+
+def _run_analysis(raw: bytes, filename: Optional[str], opts: dict, tenant: "tenants.Tenant",
+                  degraded: Optional[dict], deadline: Deadline, on_event=None) -> dict:
+    coverage: dict = {}
+    if opts.get("large_document"):
+        # no page/char caps: pages are extracted, segmented and scored as a stream
+        hasher = ContentHasher()
+
+        def hashed(pages):
+            for page in pages:
+                hasher.update(page)
+                yield page
+
+        res = analyze_pages(hashed(iter_pages(raw, filename, coverage, deadline)), opts,
+                            on_event=on_event, tenant=tenant, deadline=deadline)
+        digest = hasher.hexdigest()
+    else:
+        max_pages = int(opts.get("max_pages", 20))
+        with stage("extract_text"):
+            text, _ = extract_bytes(raw, filename, max_pages=max_pages, max_chars=60_000, coverage=coverage, deadline=deadline)
+        if not text.strip():
+            return {**_empty_result(deadline.started_at), "coverage": coverage, "deadline": deadline.report()}
+        res = analyze_contract(text, opts, on_event=on_event, tenant=tenant, deadline=deadline)
+        digest = content_hash(text)
+
+    res["duration_ms"] = int(deadline.elapsed() * 1000)
+    res["deadline"] = deadline.report()
+    res["coverage"] = coverage
+    if not res["clauses"]:
+        return res
+    _finish(res, tenant, degraded)
+    _record(res, digest, filename, opts)
+    _remember(res)
     return res
 
+def _profiled_analysis(enabled: bool, raw, filename, opts, tenant, degraded, deadline) -> dict:
+    # runs on the worker thread so cProfile sees the analysis itself
+    with profiling.profiled(enabled, "/analyze", {"filename": filename}) as prof:
+        res = _run_analysis(raw, filename, opts, tenant, degraded, deadline)
+    if prof:
+        res["profile_id"] = prof.id
+    return res
+
+@app.post("/analyze")
+async def analyze(file: UploadFile = File(...), options: str = Form("{}"),
+                  x_profile: Optional[str] = Header(None), x_api_key: Optional[str] = Header(None),
+                  x_tenant: Optional[str] = Header(None)):
+    opts = _parse_options(options)
+    tenant, degraded = _admit(opts, x_api_key, x_tenant)  # first: it may turn the LLM off
+    deadline = deadline_for(opts)  # time_budget_sec counts from here, for every stage; reserve sized for use_llm
+    raw = await file.read()
+
+    if profiling.requested(opts, x_profile):
+        # a profile is of this request alone, so it never joins another one
+        return await run_in_threadpool(_profiled_analysis, True, raw, file.filename, opts, tenant, degraded, deadline)
+
+    res, shared = await _flights.do(
+        _flight_key(raw, file.filename, opts, tenant),
+        lambda: run_in_threadpool(_run_analysis, raw, file.filename, opts, tenant, degraded, deadline),
+    )
+    return {**res, "coalesced": True} if shared else res
+
+@app.post("/analyze/stream")
+async def analyze_stream(file: UploadFile = File(...), options: str = Form("{}"),
+                         x_api_key: Optional[str] = Header(None), x_tenant: Optional[str] = Header(None)):
+    """
+    Same analysis as /analyze, streamed as NDJSON: one ``clause`` event per scored
+    clause, ``llm`` events (``partial: true`` while a note is still generating),
+    then a final ``result`` event carrying the full /analyze payload. A duplicate
+    of a stream still running replays its events so far and then follows it.
+    """
+    opts = _parse_options(options)
+    tenant, degraded = _admit(opts, x_api_key, x_tenant)  # first: it may turn the LLM off
+    deadline = deadline_for(opts)  # time_budget_sec counts from here, for every stage; reserve sized for use_llm
+    raw = await file.read()
+    key = _flight_key(raw, file.filename, opts, tenant)
+
+    with _streams_lock:
+        log = _streams.get(key)
+        leader = log is None
+        if leader:
+            log = _streams[key] = EventLog()
+
+    def run():
+        try:
+            res = _run_analysis(raw, file.filename, opts, tenant, degraded, deadline, on_event=log.append)
+            log.append({"event": "result", "result": res})
+        except Exception as e:
+            log.append({"event": "error", "detail": str(e)})
+        finally:
+            with _streams_lock:
+                _streams.pop(key, None)
+            log.close()
+
+    if leader:
+        threading.Thread(target=run, daemon=True).start()
+
+    def ndjson():
+        for ev in log.follow():
+            yield json.dumps(ev, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+# ---------- Tenant usage ----------
+@app.get("/usage")
+def usage(all: bool = False, x_api_key: Optional[str] = Header(None), x_tenant: Optional[str] = Header(None),
+          x_admin_token: Optional[str] = Header(None)):
+    """Caller's quota usage; ``all=true`` lists every tenant (needs X-Admin-Token)."""
+    if all:
+        if not tenants.ADMIN_TOKEN or x_admin_token != tenants.ADMIN_TOKEN:
+            return PlainTextResponse("Listing all tenants needs the X-Admin-Token header", status_code=403)
+        return {"tenants": tenants.all_usage()}
+    return tenants.resolve(x_api_key, x_tenant).snapshot()
+
+# ---------- Portfolio analytics ----------
+@app.get("/portfolio/contracts")
+def portfolio_contracts(
+    rule: List[str] = Query([]),
+    min_score: Optional[int] = None,
+    max_score: Optional[int] = None,
+    counterparty: Optional[str] = None,
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    bucket: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    limit: int = Query(100, le=1000),
+    offset: int = 0,
+):
+    """
+    Stored analyses matching all filters; repeated ``rule`` params must all be hit.
+    """
+    return get_store().contracts(
+        rules=rule, min_score=min_score, max_score=max_score, counterparty=counterparty,
+        status=status, category=category, bucket=bucket, date_from=date_from, date_to=date_to,
+        limit=limit, offset=offset,
+    )
+
+@app.get("/portfolio/stats")
+def portfolio_stats(
+    group_by: str = "rule",
+    rule: List[str] = Query([]),
+    min_score: Optional[int] = None,
+    max_score: Optional[int] = None,
+    counterparty: Optional[str] = None,
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    bucket: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+):
+    try:
+        return get_store().stats(
+            group_by, rules=rule, min_score=min_score, max_score=max_score, counterparty=counterparty,
+            status=status, category=category, bucket=bucket, date_from=date_from, date_to=date_to,
+        )
+    except ValueError as e:
+        return PlainTextResponse(str(e), status_code=400)
+
+@app.post("/portfolio/compact")
+def portfolio_compact():
+    return get_store().compact()
+
+@app.post("/whatif")
+def whatif_rescore(payload: dict):
+    """
+    Re-score all stored analyses under candidate rule weights.
+    Body: {"weights": {rule: weight}} or {"candidates": [{...}, ...]}, optional "top".
+    """
+    candidates = payload.get("candidates") or [payload.get("weights") or {}]
+    try:
+        matrix = whatif.load_matrix(get_store())
+        return whatif.compare(matrix, candidates, top=int(payload.get("top", 20)))
+    except (TypeError, ValueError) as e:
+        return PlainTextResponse(f"Invalid weights: {e}", status_code=400)
+
+# ---------- Stored profiles ----------
+@app.get("/profiles/{profile_id}")
+def get_profile(profile_id: str, format: str = "json", x_profile: Optional[str] = Header(None)):
+    """
+    Profile of an /analyze or /report/pdf call made with profiling on:
+    ``format=json`` (stage timings + top functions) or ``format=pstats``.
+    """
+    if not profiling.authorized(x_profile):
+        return PlainTextResponse("Profile download needs the admin X-Profile token", status_code=403)
+    path = profiling.path_for(profile_id, format)
+    if path is None:
+        return PlainTextResponse("Unknown or expired profile_id", status_code=404)
+    if format == "pstats":
+        return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+    return FileResponse(path, media_type="application/json")
+
 # ---------- Simple Markdown (for .md export) ----------
 def build_markdown(payload: dict) -> str:
     md = []
@@ -79,9 +329,35 @@ async def report(payload: dict):
     md = build_markdown(payload)
     return PlainTextResponse(md, media_type="text/markdown; charset=utf-8")
 
+@app.get("/report", response_class=PlainTextResponse)
+def report_by_id(analysis_id: str):
+    payload = _recall(analysis_id)
+    if payload is None:
+        return PlainTextResponse("Unknown or expired analysis_id", status_code=404)
+    return PlainTextResponse(build_markdown(payload), media_type="text/markdown; charset=utf-8")
+
 # ---------- Styled PDF Report (safe + wrapped) ----------
 @app.post("/report/pdf")
-async def report_pdf(payload: dict):
+async def report_pdf(payload: dict, profile: bool = False, x_profile: Optional[str] = Header(None)):
+    return _profiled_pdf(payload, profile, x_profile)
+
+@app.get("/report/pdf")
+def report_pdf_by_id(analysis_id: str, profile: bool = False, x_profile: Optional[str] = Header(None)):
+    payload = _recall(analysis_id)
+    if payload is None:
+        return PlainTextResponse("Unknown or expired analysis_id", status_code=404)
+    return _profiled_pdf(payload, profile, x_profile)
+
+def _profiled_pdf(payload: dict, profile: bool, x_profile: Optional[str]):
+    enabled = profiling.requested({"profile": profile}, x_profile)
+    with profiling.profiled(enabled, "/report/pdf", {"analysis_id": payload.get("analysis_id")}) as prof:
+        with stage("build_pdf"):
+            resp = build_pdf_response(payload)
+    if prof:
+        resp.headers["X-Profile-Id"] = prof.id
+    return resp
+
+def build_pdf_response(payload: dict):
     """
     Generate a professional PDF report with margins, wrapping, tables, and safe text.
     """
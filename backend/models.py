@@ -7,17 +7,26 @@ class Clause(BaseModel):
     text: str
     risk: int = 0
     rule_hits: List[str] = []
+    dampen: int = 0  # dampener total from rules.rule_signals, kept for what-if re-scoring
 
 class LLMNote(BaseModel):
     explanation: Optional[str] = None
     issue: Optional[str] = None
     alt_clause: Optional[str] = None
     risk_0_10: Optional[int] = None
+    source: Optional[str] = None  # "library" when served from rules/clauses.json
+    usage: Optional[Dict[str, Any]] = None  # prompt/completion tokens and cost_usd of the call
 
 class AnalysisOptions(BaseModel):
     lang: str = "English"
     max_pages: int = 20
     use_llm: bool = False
+    use_library: bool = True
+    time_budget_sec: int = 15
+    llm_min_risk: int = -1  # skip the LLM for clauses scoring <= this (-1 = no gate)
+    large_document: bool = False  # stream all pages instead of the max_pages / 60k-char caps
+    max_llm_tokens: Optional[int] = None  # per-request LLM token ceiling (riskiest clauses first)
+    max_llm_cost_usd: Optional[float] = None
 
 class TopRisk(BaseModel):
     title: str
@@ -30,3 +39,8 @@ class AnalysisResult(BaseModel):
     duration_ms: int
     top_risks: List[TopRisk] = []
     clauses: List[Dict[str, Any]] = []
+    llm_stats: Dict[str, int] = {}
+    degraded: Optional[Dict[str, Any]] = None  # set when a tenant quota forced heuristic-only output
+    coverage: Dict[str, Any] = {}  # pages/chars analysed, ratio of the document, truncated
+    llm_usage: Dict[str, Any] = {}  # per-request token and cost totals
+    deadline: Dict[str, Any] = {}  # budget_sec, elapsed_ms, met, skipped (pages / entities / llm)
@@ -0,0 +1,338 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+# ---------- Portfolio store ----------
+# Clause-level rule hits, scores, entities and contract metadata of every
+# analysis, appended to an indexed SQLite file so portfolio questions
+# ("active vendor contracts with unlimited liability and a foreign forum")
+# are answered without re-running analyses.
+DB_PATH = os.getenv(
+    "PORTFOLIO_DB",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "portfolio.db"),
+)
+ENABLED = os.getenv("PORTFOLIO_ENABLED", "1") != "0"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contracts (
+    id            INTEGER PRIMARY KEY,
+    content_hash  TEXT NOT NULL,
+    doc_key       TEXT,
+    filename      TEXT,
+    counterparty  TEXT,
+    contract_date TEXT,
+    status        TEXT,
+    category      TEXT,
+    analysed_at   TEXT NOT NULL,
+    overall_score INTEGER NOT NULL,
+    bucket        TEXT NOT NULL,
+    clause_count  INTEGER NOT NULL,
+    rule_mask     INTEGER NOT NULL DEFAULT 0,
+    superseded    INTEGER NOT NULL DEFAULT 0,
+    meta          TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_contracts_hash ON contracts(content_hash);
+CREATE INDEX IF NOT EXISTS ix_contracts_score ON contracts(superseded, overall_score);
+CREATE INDEX IF NOT EXISTS ix_contracts_counterparty ON contracts(counterparty COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS ix_contracts_date ON contracts(contract_date);
+CREATE INDEX IF NOT EXISTS ix_contracts_status ON contracts(status, category);
+
+-- one bit per rule in contracts.rule_mask; rule filters and per-rule stats
+-- become a single scan of contracts instead of a join over rule_hits
+CREATE TABLE IF NOT EXISTS rules (
+    bit  INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS clauses (
+    contract_id INTEGER NOT NULL,
+    clause_id   TEXT NOT NULL,
+    title       TEXT,
+    risk        INTEGER NOT NULL,
+    dampen      INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (contract_id, clause_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_clauses_risk ON clauses(risk);
+
+CREATE TABLE IF NOT EXISTS rule_hits (
+    rule        TEXT NOT NULL,
+    contract_id INTEGER NOT NULL,
+    clause_id   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_hits_rule ON rule_hits(rule, contract_id);
+CREATE INDEX IF NOT EXISTS ix_hits_contract ON rule_hits(contract_id);
+
+CREATE TABLE IF NOT EXISTS entities (
+    contract_id INTEGER NOT NULL,
+    clause_id   TEXT NOT NULL,
+    label       TEXT NOT NULL,
+    text        TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_entities_label ON entities(label, text);
+CREATE INDEX IF NOT EXISTS ix_entities_contract ON entities(contract_id);
+"""
+
+GROUPS = {
+    "bucket": "c.bucket",
+    "counterparty": "c.counterparty",
+    "status": "c.status",
+    "category": "c.category",
+    "month": "substr(c.contract_date, 1, 7)",
+}
+
+MAX_RULES = 63
+
+ENTITY_RE = re.compile(r"^(?P<text>.*) \((?P<label>[A-Z_]+)\)$")
+
+class PortfolioStore:
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        cols = {r["name"] for r in self._conn.execute("PRAGMA table_info(clauses)")}
+        if "dampen" not in cols:
+            self._conn.execute("ALTER TABLE clauses ADD COLUMN dampen INTEGER NOT NULL DEFAULT 0")
+        cols = {r["name"] for r in self._conn.execute("PRAGMA table_info(contracts)")}
+        if "doc_key" not in cols:
+            with self._conn:
+                self._conn.execute("ALTER TABLE contracts ADD COLUMN doc_key TEXT")
+                self._conn.execute("UPDATE contracts SET doc_key = content_hash || '|' || lower(coalesce(counterparty, ''))")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_contracts_doc ON contracts(doc_key, superseded)")
+
+    # --- writes ---
+    def append(self, result: Dict[str, Any], content_hash: str, filename: str = "",
+               metadata: Optional[Dict[str, Any]] = None) -> int:
+        """Record one analysis; earlier rows for the same document are marked superseded.
+
+        A document is ``metadata["document_id"]`` when the caller supplies one,
+        otherwise the text together with its counterparty: one template signed
+        with two counterparties is two contracts."""
+        meta = dict(metadata or {})
+        clauses = result.get("clauses", []) or []
+        ents = [(c["id"], m.group("label"), m.group("text"))
+                for c in clauses for e in (c.get("entities") or [])
+                for m in [ENTITY_RE.match(str(e))] if m]
+        counterparty = meta.pop("counterparty", None) or _first_org(ents)
+        document_id = meta.pop("document_id", None)
+        doc_key = f"id:{document_id}" if document_id else f"{content_hash}|{(counterparty or '').lower()}"
+
+        with self._lock, self._conn:
+            mask = self._mask({h for c in clauses for h in (c.get("rule_hits") or [])}, create=True)
+            self._conn.execute(
+                "UPDATE contracts SET superseded = 1 WHERE doc_key = ? AND superseded = 0",
+                (doc_key,),
+            )
+            cur = self._conn.execute(
+                "INSERT INTO contracts (content_hash, doc_key, filename, counterparty, contract_date, status, category,"
+                " analysed_at, overall_score, bucket, clause_count, rule_mask, meta)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    content_hash, doc_key, filename, counterparty,
+                    meta.pop("contract_date", None), meta.pop("status", None), meta.pop("category", None),
+                    datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    int(result.get("overall_score", 0)), result.get("bucket", "Low"), len(clauses), mask,
+                    json.dumps(meta, ensure_ascii=False) if meta else None,
+                ),
+            )
+            cid = cur.lastrowid
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO clauses (contract_id, clause_id, title, risk, dampen) VALUES (?, ?, ?, ?, ?)",
+                [(cid, c["id"], c.get("title"), int(c.get("risk", 0)), int(c.get("dampen", 0))) for c in clauses],
+            )
+            self._conn.executemany(
+                "INSERT INTO rule_hits (rule, contract_id, clause_id) VALUES (?, ?, ?)",
+                [(h, cid, c["id"]) for c in clauses for h in (c.get("rule_hits") or [])],
+            )
+            self._conn.executemany(
+                "INSERT INTO entities (contract_id, clause_id, label, text) VALUES (?, ?, ?, ?)",
+                [(cid, clause_id, label, text) for clause_id, label, text in ents],
+            )
+        return cid
+
+    def _rule_bits(self) -> Dict[str, int]:
+        return {r["name"]: r["bit"] for r in self._conn.execute("SELECT bit, name FROM rules")}
+
+    def _mask(self, names, create: bool = False) -> Optional[int]:
+        """Bitmask for ``names``; None if a name was never stored (and not created)."""
+        bits = self._rule_bits()
+        mask = 0
+        for n in sorted(names):
+            if n not in bits:
+                if not create:
+                    return None
+                if len(bits) >= MAX_RULES:
+                    raise ValueError(f"portfolio store supports at most {MAX_RULES} rules")
+                bits[n] = len(bits)
+                self._conn.execute("INSERT INTO rules (bit, name) VALUES (?, ?)", (bits[n], n))
+            mask |= 1 << bits[n]
+        return mask
+
+    def compact(self) -> Dict[str, int]:
+        """Drop superseded analyses, refresh planner stats and reclaim space."""
+        with self._lock:
+            with self._conn:
+                old = [r[0] for r in self._conn.execute("SELECT id FROM contracts WHERE superseded = 1")]
+                for table, col in (("rule_hits", "contract_id"), ("entities", "contract_id"),
+                                   ("clauses", "contract_id"), ("contracts", "id")):
+                    self._conn.executemany(f"DELETE FROM {table} WHERE {col} = ?", [(i,) for i in old])
+            self._conn.execute("ANALYZE")
+            self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            live = self._conn.execute("SELECT COUNT(*) FROM contracts").fetchone()[0]
+        return {"removed": len(old), "contracts": live}
+
+    # --- reads ---
+    def _where(self, rules: Sequence[str] = (), min_score: Optional[int] = None,
+               max_score: Optional[int] = None, counterparty: Optional[str] = None,
+               status: Optional[str] = None, category: Optional[str] = None,
+               bucket: Optional[str] = None, date_from: Optional[str] = None,
+               date_to: Optional[str] = None):
+        sql, args = ["c.superseded = 0"], []
+        if min_score is not None:
+            sql.append("c.overall_score >= ?"); args.append(min_score)
+        if max_score is not None:
+            sql.append("c.overall_score <= ?"); args.append(max_score)
+        if counterparty:
+            sql.append("c.counterparty = ? COLLATE NOCASE"); args.append(counterparty)
+        if status:
+            sql.append("c.status = ?"); args.append(status)
+        if category:
+            sql.append("c.category = ?"); args.append(category)
+        if bucket:
+            sql.append("c.bucket = ?"); args.append(bucket)
+        if date_from:
+            sql.append("c.contract_date >= ?"); args.append(date_from)
+        if date_to:
+            sql.append("c.contract_date <= ?"); args.append(date_to)
+        if rules:
+            # contracts that hit *all* requested rules
+            mask = self._mask(set(rules))
+            if mask is None:
+                sql.append("0")
+            else:
+                sql.append("(c.rule_mask & ?) = ?"); args += [mask, mask]
+        return " AND ".join(sql), args
+
+    def contracts(self, limit: int = 100, offset: int = 0, **filters) -> Dict[str, Any]:
+        with self._lock:
+            where, args = self._where(**filters)
+            bits = self._rule_bits()
+            total = self._conn.execute(f"SELECT COUNT(*) FROM contracts c WHERE {where}", args).fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT c.id, c.filename, c.counterparty, c.contract_date, c.status, c.category,"
+                " c.analysed_at, c.overall_score, c.bucket, c.clause_count, c.rule_mask"
+                f" FROM contracts c WHERE {where} ORDER BY c.overall_score DESC, c.id DESC LIMIT ? OFFSET ?",
+                args + [limit, offset],
+            ).fetchall()
+        items = []
+        for r in rows:
+            d = dict(r)
+            mask = d.pop("rule_mask")
+            d["rules"] = sorted(n for n, b in bits.items() if mask >> b & 1)
+            items.append(d)
+        return {"total": total, "items": items}
+
+    def stats(self, group_by: str = "rule", **filters) -> List[Dict[str, Any]]:
+        if group_by != "rule" and group_by not in GROUPS:
+            raise ValueError(f"group_by must be one of: rule, {', '.join(GROUPS)}")
+        with self._lock:
+            where, args = self._where(**filters)
+            if group_by != "rule":
+                rows = self._conn.execute(
+                    f"SELECT {GROUPS[group_by]} AS key, COUNT(*) AS contracts,"
+                    " AVG(c.overall_score) AS avg_score, MAX(c.overall_score) AS max_score"
+                    f" FROM contracts c WHERE {where} GROUP BY key ORDER BY contracts DESC",
+                    args,
+                ).fetchall()
+                return [{**dict(r), "avg_score": round(r["avg_score"] or 0, 2)} for r in rows]
+
+            # per-rule aggregates in one pass over contracts
+            bits = sorted(self._rule_bits().items(), key=lambda kv: kv[1])
+            if not bits:
+                return []
+            cols = ", ".join(
+                f"SUM(c.rule_mask >> {b} & 1), AVG(CASE WHEN c.rule_mask >> {b} & 1 THEN c.overall_score END),"
+                f" MAX(CASE WHEN c.rule_mask >> {b} & 1 THEN c.overall_score END)"
+                for _, b in bits
+            )
+            row = self._conn.execute(f"SELECT {cols} FROM contracts c WHERE {where}", args).fetchone()
+        out = []
+        for i, (name, _) in enumerate(bits):
+            n, avg, mx = row[3 * i], row[3 * i + 1], row[3 * i + 2]
+            if n:
+                out.append({"key": name, "contracts": n, "avg_score": round(avg or 0, 2), "max_score": mx})
+        return sorted(out, key=lambda r: r["contracts"], reverse=True)
+
+    def version(self) -> tuple:
+        """Changes whenever analyses are appended or compacted; used to cache derived data."""
+        with self._lock:
+            return tuple(self._conn.execute("SELECT COUNT(*), MAX(id) FROM contracts").fetchone())
+
+    def scoring_rows(self):
+        """(contract ids, clause rows, hit rows) of live analyses for what-if scoring."""
+        with self._lock:
+            contracts = self._conn.execute(
+                "SELECT id, filename, overall_score FROM contracts WHERE superseded = 0 ORDER BY id"
+            ).fetchall()
+            clauses = self._conn.execute(
+                "SELECT k.contract_id, k.clause_id, k.dampen FROM clauses k"
+                " JOIN contracts c ON c.id = k.contract_id WHERE c.superseded = 0"
+            ).fetchall()
+            hits = self._conn.execute(
+                "SELECT h.contract_id, h.clause_id, h.rule FROM rule_hits h"
+                " JOIN contracts c ON c.id = h.contract_id WHERE c.superseded = 0"
+            ).fetchall()
+        return contracts, clauses, hits
+
+def _first_org(ents) -> Optional[str]:
+    for _, label, text in ents:
+        if label == "ORG":
+            return text
+    return None
+
+_PAGE_MARK_RE = re.compile(r"===PAGE===")
+_SPACE_RE = re.compile(r"\s+")
+
+class ContentHasher:
+    """Document digest over the extracted text with page marks and all
+    whitespace dropped, so it is the same whether the text is hashed whole
+    (standard mode) or page by page as it streams (large documents)."""
+
+    def __init__(self):
+        self._h = hashlib.sha256()
+
+    def update(self, text: str) -> None:
+        text = _SPACE_RE.sub("", _PAGE_MARK_RE.sub("", text))
+        self._h.update(text.encode("utf-8", errors="ignore"))
+
+    def hexdigest(self) -> str:
+        return self._h.hexdigest()
+
+def content_hash(text: str) -> str:
+    h = ContentHasher()
+    h.update(text)
+    return h.hexdigest()
+
+_store: Optional[PortfolioStore] = None
+_store_lock = threading.Lock()
+
+def get_store() -> PortfolioStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PortfolioStore()
+        return _store
@@ -0,0 +1,151 @@
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# ---------- Per-request profiling ----------
+# Off unless asked for: X-Profile header equal to PROFILE_ADMIN_TOKEN, or the
+# option "profile": true on a server started with PROFILING=1 (the same gate
+# covers downloads from /profiles). A profiled request gets stage wall-clock timers and,
+# when no other request holds the profiler, a cProfile run of the request
+# thread. Both are written to PROFILE_DIR as <id>.prof (pstats; snakeviz /
+# flameprof / gprof2dot read it) and <id>.json, and served by /profiles/<id>.
+# With profiling off, stage() is a single ContextVar lookup.
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "profiles"),
+)
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILING = os.getenv("PROFILING", "0") == "1"
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+TOP_FUNCTIONS = 30
+
+ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+_current: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar("profile", default=None)
+# one deterministic profiler at a time; overlapping requests still get stage timers
+_cprofile_lock = threading.Lock()
+
+class Profile:
+    def __init__(self, endpoint: str, meta: Optional[Dict] = None):
+        self.id = uuid.uuid4().hex
+        self.created = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.endpoint = endpoint
+        self.meta = meta or {}
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._prof: Optional[cProfile.Profile] = None
+        self._t0 = 0.0
+        self.wall_ms = 0.0
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            s = self.stages.setdefault(name, {"ms": 0.0, "calls": 0})
+            s["ms"] += seconds * 1000
+            s["calls"] += 1
+
+    def summary(self) -> Dict:
+        out = {
+            "id": self.id,
+            "endpoint": self.endpoint,
+            "created": self.created,
+            "wall_ms": round(self.wall_ms, 1),
+            # llm_wait is summed over parallel calls, so it can exceed wall_ms
+            "stages": {k: {"ms": round(v["ms"], 1), "calls": v["calls"]} for k, v in self.stages.items()},
+            "cprofile": self._prof is not None,
+            **self.meta,
+        }
+        if self._prof is not None:
+            buf = io.StringIO()
+            pstats.Stats(self._prof, stream=buf).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            out["top_functions"] = buf.getvalue()
+        return out
+
+def authorized(header: Optional[str] = None) -> bool:
+    """May this caller read stored profiles? The admin token, once set, is the
+    only key; without one, profiles are served only when PROFILING is on."""
+    if PROFILE_ADMIN_TOKEN:
+        return header == PROFILE_ADMIN_TOKEN
+    return PROFILING
+
+def requested(opts: Optional[Dict] = None, header: Optional[str] = None) -> bool:
+    if PROFILE_ADMIN_TOKEN and header == PROFILE_ADMIN_TOKEN:
+        return True
+    return PROFILING and bool(opts and opts.get("profile"))
+
+def current() -> Optional[Profile]:
+    return _current.get()
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage for the active profile (no-op when not profiling)."""
+    prof = _current.get()
+    if prof is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        prof.add(name, time.perf_counter() - t0)
+
+@contextmanager
+def profiled(enabled: bool, endpoint: str, meta: Optional[Dict] = None):
+    """Profile the enclosed block when ``enabled``; yields the Profile or None."""
+    if not enabled:
+        yield None
+        return
+    prof = Profile(endpoint, meta)
+    token = _current.set(prof)
+    owns = _cprofile_lock.acquire(blocking=False)
+    if owns:
+        prof._prof = cProfile.Profile()
+        prof._prof.enable()
+    prof._t0 = time.perf_counter()
+    try:
+        yield prof
+    finally:
+        prof.wall_ms = (time.perf_counter() - prof._t0) * 1000
+        if owns:
+            prof._prof.disable()
+            _cprofile_lock.release()
+        _current.reset(token)
+        try:
+            _save(prof)
+        except OSError:
+            pass  # a full disk must not fail the request being profiled
+
+def _save(prof: Profile):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    if prof._prof is not None:
+        prof._prof.dump_stats(os.path.join(PROFILE_DIR, prof.id + ".prof"))
+    with open(os.path.join(PROFILE_DIR, prof.id + ".json"), "w", encoding="utf-8") as f:
+        json.dump(prof.summary(), f, indent=2)
+    _prune()
+
+def _prune():
+    files = [os.path.join(PROFILE_DIR, n) for n in os.listdir(PROFILE_DIR) if n.endswith(".json")]
+    if len(files) <= PROFILE_KEEP:
+        return
+    files.sort(key=os.path.getmtime)
+    for path in files[:-PROFILE_KEEP]:
+        for p in (path, path[:-5] + ".prof"):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+def path_for(profile_id: str, fmt: str = "json") -> Optional[str]:
+    """Path of a stored profile (``json`` summary or ``pstats`` dump), if present."""
+    if not ID_RE.match(profile_id or ""):
+        return None
+    path = os.path.join(PROFILE_DIR, profile_id + (".prof" if fmt == "pstats" else ".json"))
+    return path if os.path.exists(path) else None
@@ -0,0 +1,198 @@
+import abc
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ---------- Provider selection ----------
+# LLM_PROVIDER: groq | openai | stub. Unset means Groq when GROQ_API_KEY is
+# present, otherwise no provider (heuristic-only). "openai" is any
+# OpenAI-compatible endpoint, e.g. a local llama.cpp / vLLM server, so
+# on-prem deployments keep contract text off the internet.
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "").strip().lower()
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
+
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "http://localhost:8080/v1")
+LLM_API_KEY = os.getenv("LLM_API_KEY", "not-needed")
+LLM_MODEL = os.getenv("LLM_MODEL", "local-model")
+
+STUB_LATENCY_MS = int(os.getenv("LLM_STUB_LATENCY_MS", "0"))
+
+# ---------- Shared HTTP pool ----------
+POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "20"))
+POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "10"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "60"))
+HTTP2 = os.getenv("LLM_HTTP2", "1") != "0"
+
+DEFAULT_CONCURRENCY = {"groq": 4, "openai": 2, "stub": 8}
+
+_http_client: Optional[httpx.Client] = None
+_http_lock = threading.Lock()
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def http_client() -> httpx.Client:
+    """Process-wide pooled client (HTTP/2 + keep-alive) shared by all providers."""
+    global _http_client
+    with _http_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                http2=HTTP2 and _http2_available(),
+                limits=httpx.Limits(
+                    max_connections=POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            )
+        return _http_client
+
+# ---------- Providers ----------
+class ProviderBusy(Exception):
+    pass
+
+class Provider(abc.ABC):
+    name = "base"
+
+    def __init__(self, model: str, max_concurrency: int):
+        self.model = model
+        self.max_concurrency = max(1, max_concurrency)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+
+    def stream_chat(self, messages: List[Dict], timeout: float, temperature: float = 0.2,
+                    max_tokens: Optional[int] = None) -> Iterator[str]:
+        """Yield completion text deltas, holding one of the provider's slots.
+        ``timeout`` covers both the wait for a slot and the call itself."""
+        t0 = time.monotonic()
+        if not self._slots.acquire(timeout=timeout):
+            raise ProviderBusy(f"{self.name}: no free slot within {timeout}s")
+        try:
+            left = timeout - (time.monotonic() - t0)
+            if left <= 0:
+                raise ProviderBusy(f"{self.name}: no time left after waiting for a slot")
+            yield from self._stream(messages, left, temperature, max_tokens)
+        finally:
+            self._slots.release()
+
+    @abc.abstractmethod
+    def _stream(self, messages: List[Dict], timeout: float, temperature: float,
+                max_tokens: Optional[int]) -> Iterator[str]:
+        """Yield completion text deltas; called with a slot held."""
+
+class _SDKProvider(Provider):
+    """Groq and OpenAI SDKs share the chat.completions streaming interface."""
+
+    def __init__(self, client, model: str, max_concurrency: int):
+        super().__init__(model, max_concurrency)
+        self.client = client
+
+    def _stream(self, messages, timeout, temperature, max_tokens):
+        extra = {"max_tokens": max_tokens} if max_tokens else {}
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            temperature=temperature,
+            messages=messages,
+            stream=True,
+            timeout=timeout,
+            **extra,
+        )
+        try:
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+        finally:
+            stream.close()
+
+class GroqProvider(_SDKProvider):
+    name = "groq"
+
+    def __init__(self, max_concurrency: int):
+        from groq import Groq
+        super().__init__(Groq(api_key=GROQ_API_KEY, http_client=http_client()), GROQ_MODEL, max_concurrency)
+
+class OpenAICompatProvider(_SDKProvider):
+    name = "openai"
+
+    def __init__(self, max_concurrency: int):
+        from openai import OpenAI
+        client = OpenAI(base_url=LLM_BASE_URL, api_key=LLM_API_KEY, http_client=http_client())
+        super().__init__(client, LLM_MODEL, max_concurrency)
+
+class StubProvider(Provider):
+    """Deterministic offline provider for tests, demos and load runs."""
+    name = "stub"
+
+    def __init__(self, max_concurrency: int, latency_ms: int = STUB_LATENCY_MS):
+        super().__init__("stub", max_concurrency)
+        self.latency_ms = latency_ms
+
+    def _stream(self, messages, timeout, temperature, max_tokens):
+        prompt = messages[-1]["content"] if messages else ""
+        body = stub_completion(prompt)
+        step = 16
+        pieces = [body[i:i + step] for i in range(0, len(body), step)]
+        pause = self.latency_ms / 1000.0 / max(1, len(pieces))
+        for p in pieces:
+            if pause:
+                time.sleep(pause)
+            yield p
+
+def stub_completion(prompt: str) -> str:
+    """Stable JSON answer derived from the prompt text."""
+    title = "Clause"
+    for line in prompt.splitlines():
+        if line.startswith("Clause title:"):
+            title = line.split(":", 1)[1].strip() or title
+            break
+    digest = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16)
+    return json.dumps({
+        "explanation": f"Offline stub review of the {title} clause.",
+        "issue": None,
+        "alt_clause": None,
+        "risk_0_10": digest % 11,
+    })
+
+_provider: Optional[Provider] = None
+_provider_lock = threading.Lock()
+
+def _build_provider() -> Optional[Provider]:
+    name = LLM_PROVIDER or ("groq" if GROQ_API_KEY else "")
+    if not name:
+        return None
+    conc = int(os.getenv("LLM_MAX_CONCURRENCY", DEFAULT_CONCURRENCY.get(name, 2)))
+    if name == "groq":
+        return GroqProvider(conc) if GROQ_API_KEY else None
+    if name in ("openai", "local"):
+        return OpenAICompatProvider(conc)
+    if name == "stub":
+        return StubProvider(conc)
+    return None
+
+def get_provider() -> Optional[Provider]:
+    """Configured provider, built once per process; None means heuristic-only."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = _build_provider()
+        return _provider
+
+def set_provider(provider: Optional[Provider]):
+    """Override the process-wide provider (tests, load runs)."""
+    global _provider
+    with _provider_lock:
+        _provider = provider
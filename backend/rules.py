@@ -1,7 +1,7 @@
 import json
 import os
 import re
-from typing import List, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from models import Clause
 import spacy
 
@@ -51,15 +51,29 @@ def normalize_whitespace(t: str) -> str:
     return t
 
 # ---------- Clause detection ----------
+MIN_LOOSE_CHARS = 40  # shorter blocks under a mid-line heading are stray keyword hits
+
+def _heading_re(text: str) -> Optional[re.Pattern]:
+    """STRONG_HEAD_RE if a line starts with a heading, else LOOSE_HEAD_RE if
+    a heading word appears anywhere, else None."""
+    for rx in (STRONG_HEAD_RE, LOOSE_HEAD_RE):
+        if rx.search(text):
+            return rx
+    return None
+
+def _keep(rx: re.Pattern, cl: Clause, n_blocks: int) -> bool:
+    return rx is STRONG_HEAD_RE or n_blocks <= 1 or len(cl.text) >= MIN_LOOSE_CHARS
+
+def _body(text: str, start: int, end: int, raw_title: str) -> str:
+    return text[start:end].strip()[len(raw_title):].lstrip(" :-\n\r\t")
+
 def _split_by_matches(text: str, matches: List[re.Match]) -> List[Clause]:
     blocks = []
     for i, m in enumerate(matches):
-        start = m.start()
         raw_title = m.group("head")
         title = cleanup_heading(raw_title)
         end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
-        body = text[start:end].strip()
-        body = body[len(raw_title):].lstrip(" :-\n\r\t")
+        body = _body(text, m.start(), end, raw_title)
 
         if blocks and blocks[-1].title == title:
             prev = blocks[-1]
@@ -71,21 +85,12 @@ def _split_by_matches(text: str, matches: List[re.Match]) -> List[Clause]:
 def detect_clauses(text: str) -> List[Clause]:
     text = normalize_whitespace(text)
 
-    strong = list(STRONG_HEAD_RE.finditer(text))
-    if strong:
-        blocks = _split_by_matches(text, strong)
+    rx = _heading_re(text)
+    if rx is not None:
+        blocks = _split_by_matches(text, list(rx.finditer(text)))
+        blocks = [b for b in blocks if _keep(rx, b, len(blocks))]
         if blocks: return blocks
 
-    loose = list(LOOSE_HEAD_RE.finditer(text))
-    if loose:
-        blocks = _split_by_matches(text, loose)
-        filtered: List[Clause] = []
-        for b in blocks:
-            if len(b.text) < 40 and len(blocks) > 1:
-                continue
-            filtered.append(b)
-        if filtered: return filtered
-
     paras = [p.strip() for p in text.split("\n\n") if p.strip()]
     chunks, buf = [], []
     for p in paras:
@@ -104,16 +109,103 @@ def detect_clauses(text: str) -> List[Clause]:
 
     return [Clause(id="c1", title="Contract", text=text)]
 
+# ---------- Streaming clause detection (large documents) ----------
+PREAMBLE_LIMIT = 20_000  # text held while waiting for the first heading
+
+def iter_clauses(pages: Iterable[str]) -> Iterator[Clause]:
+    """detect_clauses over a stream of pages. Only the text after the last
+    heading seen is carried into the next page, so a clause that runs across
+    a page break stays whole and memory is bounded by the longest clause.
+    The heading pattern and its fallbacks are chosen as detect_clauses does,
+    from the first PREAMBLE_LIMIT chars: line-start headings, else mid-line
+    ones (dropping short blocks), else three-paragraph chunks."""
+    buf = ""
+    rx: Optional[re.Pattern] = None
+    heads: List[Tuple[int, str]] = []  # (offset in buf, raw heading) not yet emitted
+    mode = None                        # "head" | "para" once decided
+    paras: List[str] = []
+    pending: Optional[Clause] = None   # held back so same-title blocks can merge
+    count = emitted = 0
+
+    def close(start: int, end: int, raw_title: str) -> Optional[Clause]:
+        nonlocal pending, count
+        title = cleanup_heading(raw_title)
+        body = _body(buf, start, end, raw_title)
+        if pending is not None and pending.title == title:
+            pending.text = (pending.text + "\n" + body).strip()
+            return None
+        done, count = pending, count + 1
+        pending = Clause(id=f"c{count}", title=title, text=body)
+        if done is not None and _keep(rx, done, 2):
+            return done
+        return None
+
+    def para_chunks(final: bool) -> Iterator[Clause]:
+        nonlocal count
+        while len(paras) >= 3 or (final and paras):
+            chunk, paras[:3] = paras[:3], []
+            count += 1
+            yield Clause(id=f"p{count}", title=f"Clause {count}", text="\n\n".join(chunk))
+
+    for page in pages:
+        scan_from = len(buf)
+        buf += normalize_whitespace(page) + "\n"
+        if mode is None:
+            if STRONG_HEAD_RE.search(buf, scan_from):
+                rx = STRONG_HEAD_RE
+            elif len(buf) > PREAMBLE_LIMIT:
+                rx = _heading_re(buf)
+            else:
+                continue
+            mode = "head" if rx is not None else "para"
+            scan_from = 0
+        if mode == "head":
+            heads += [(m.start(), m.group("head")) for m in rx.finditer(buf, scan_from)]
+            for (start, head), (end, _) in zip(heads, heads[1:]):
+                done = close(start, end, head)
+                if done:
+                    emitted += 1
+                    yield done
+            last = heads[-1]
+            buf, heads = buf[last[0]:], [(0, last[1])]
+        else:
+            parts = buf.split("\n\n")
+            buf = parts.pop()  # may continue on the next page
+            paras += [p.strip() for p in parts if p.strip()]
+            yield from para_chunks(final=False)
+
+    if mode is None:
+        # short document: the regular detector and its fallbacks
+        yield from detect_clauses(buf)
+    elif mode == "head":
+        done = close(0, len(buf), heads[0][1])
+        if done:
+            emitted += 1
+            yield done
+        if _keep(rx, pending, 1 + emitted):
+            yield pending
+    else:
+        if buf.strip():
+            paras.append(buf.strip())
+        yield from para_chunks(final=True)
+
 # ---------- Entity extraction ----------
+NER_LABELS = ["DATE", "MONEY", "ORG", "GPE"]
+NER_BATCH = 32
+
+def _entities(doc) -> List[str]:
+    return [f"{ent.text} ({ent.label_})" for ent in doc.ents if ent.label_ in NER_LABELS]
+
 def extract_entities(clause_text: str) -> List[str]:
     if not nlp:
         return []
-    doc = nlp(clause_text)
-    ents = []
-    for ent in doc.ents:
-        if ent.label_ in ["DATE", "MONEY", "ORG", "GPE"]:
-            ents.append(f"{ent.text} ({ent.label_})")
-    return ents
+    return _entities(nlp(clause_text))
+
+def extract_entities_batch(texts: List[str]) -> List[List[str]]:
+    """extract_entities for many clauses in one batched nlp.pipe pass."""
+    if not nlp:
+        return [[] for _ in texts]
+    return [_entities(doc) for doc in nlp.pipe(texts, batch_size=NER_BATCH)]
 
 # ---------- Heuristics (gentler) ----------
 DAYS_RE   = re.compile(r"(?:within|net)?\s*(\d{2,3})\s*day", re.I)
@@ -150,7 +242,8 @@ WEIGHTS = _load_weights()
 
 SEVERE_FLAGS = {"liability_disclaimed", "unlimited_liability"}
 
-def apply_rules(cl: Clause) -> Tuple[int, List[str]]:
+def rule_signals(cl: Clause) -> Tuple[List[str], int]:
+    """Rule hits and dampener total for a clause, before weighting."""
     hits: List[str] = []
     t = cl.text.lower()
 
@@ -207,10 +300,7 @@ def apply_rules(cl: Clause) -> Tuple[int, List[str]]:
         if any(w in t for w in ["perpetual","indefinite"]) or ("अवधि" in t and "हमेशा" in t):
             hits.append("confidentiality_perpetual")
 
-    # ---------- Scoring with dampeners ----------
-    raw = sum(WEIGHTS.get(h, 0) for h in hits)
-
-    # Dampeners (reduce noise / reward good signals)
+    # ---------- Dampeners (reduce noise / reward good signals) ----------
     dampen = 0
     # Mutual language reduces indemnity/severity noise
     if any(w in t for w in ["mutual", "each party", "दोनों पक्ष"]):
@@ -225,6 +315,12 @@ def apply_rules(cl: Clause) -> Tuple[int, List[str]]:
     if "either party may terminate" in t:
         dampen += 2
 
+    return hits, dampen
+
+def score_signals(hits: List[str], dampen: int, weights: Optional[Dict[str, int]] = None) -> int:
+    """Weighted clause score; whatif.py mirrors this in NumPy, keep them in sync."""
+    weights = WEIGHTS if weights is None else weights
+    raw = sum(weights.get(h, 0) for h in hits)
     raw = max(0, raw - dampen)
 
     # Soft cap: unless a severe flag is present, don't let small issues exceed 6/10
@@ -232,6 +328,8 @@ def apply_rules(cl: Clause) -> Tuple[int, List[str]]:
         raw = min(raw, 6)
 
     # Final clamp to 0..10
-    score = max(0, min(10, int(raw)))
+    return max(0, min(10, int(raw)))
 
-    return score, hits
+def apply_rules(cl: Clause) -> Tuple[int, List[str]]:
+    hits, dampen = rule_signals(cl)
+    return score_signals(hits, dampen), hits
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+# ---------- Single-flight ----------
+# Identical work already in flight is joined instead of repeated: the first
+# caller (leader) runs it, later callers with the same key wait for and share
+# its outcome. The key is dropped as soon as the work settles, so a failure is
+# reported to every waiter and the next caller starts afresh.
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """Thread version, for blocking work such as explain_clause."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """(result, shared). Followers raise TimeoutError after ``timeout``; the
+        leader's exception (even BaseException) is re-raised in every waiter."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError("timed out waiting for identical in-flight call")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+class AsyncSingleFlight:
+    """asyncio version for request handlers. The shared task is shielded, so a
+    waiter that disconnects is cancelled alone and the others still get the
+    result; if the task itself fails or is cancelled, every waiter sees that."""
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        task = self._tasks.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t, k=key: self._settled(k, t))
+        return await asyncio.shield(task), shared
+
+    def _settled(self, key: Hashable, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here so a task nobody awaits any more doesn't warn
+
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+# ---------- Shared event streams ----------
+class EventLog:
+    """Append-only event list; every reader replays it from the start and then
+    follows new events until the writer closes it."""
+
+    def __init__(self):
+        self._events: List[Any] = []
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def append(self, event: Any):
+        with self._cond:
+            self._events.append(event)
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def follow(self) -> Iterator[Any]:
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self._events) and not self._closed:
+                    self._cond.wait()
+                batch = self._events[i:]
+                i = len(self._events)
+                if not batch and self._closed:
+                    return
+            yield from batch
@@ -0,0 +1,228 @@
+import heapq
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# ---------- Tenants ----------
+# Requests are attributed to a tenant by X-API-Key (mapped through TENANTS_FILE)
+# or, when no key is sent and TRUST_TENANT_HEADER is on (only behind a gateway
+# that sets it), by X-Tenant naming a configured tenant. Everything else -- no
+# key, an unknown key, an unknown name -- shares the default tenant, so changing
+# a header never buys a fresh quota and the registry holds configured tenants
+# only. Each tenant has
+# token buckets for analyses and LLM tokens plus a weight in the fair queue in
+# front of the LLM. A tenant over quota gets heuristic-only results flagged
+# "degraded", never an error.
+#
+# TENANTS_FILE: {"tenants": {"acme": {"api_keys": ["..."], "weight": 2,
+#                "requests_per_min": 120, "llm_tokens_per_min": 200000}}}
+TENANTS_FILE = os.getenv("TENANTS_FILE", "")
+QUOTAS_ENABLED = os.getenv("TENANT_QUOTAS", "1") != "0"
+TRUST_TENANT_HEADER = os.getenv("TRUST_TENANT_HEADER", "0") == "1"
+DEFAULT_REQUESTS_PER_MIN = float(os.getenv("TENANT_REQUESTS_PER_MIN", "60"))
+DEFAULT_LLM_TOKENS_PER_MIN = float(os.getenv("TENANT_LLM_TOKENS_PER_MIN", "100000"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+DEFAULT_TENANT = "public"
+
+NAME_RE = re.compile(r"[^A-Za-z0-9_.:-]")
+
+class TokenBucket:
+    def __init__(self, per_min: float, capacity: Optional[float] = None):
+        self.rate = per_min / 60.0
+        self.capacity = capacity if capacity is not None else per_min  # one minute of burst
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, n: float = 1) -> bool:
+        n = min(n, self.capacity)  # an oversized call must still fit a full bucket
+        with self._lock:
+            self._refill()
+            if self.tokens < n:
+                return False
+            self.tokens -= n
+            return True
+
+    def refund(self, n: float):
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + n)
+
+    def level(self) -> float:
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+    def retry_after(self, n: float = 1) -> float:
+        with self._lock:
+            self._refill()
+            missing = min(n, self.capacity) - self.tokens
+        return round(max(0.0, missing / self.rate), 1) if self.rate else 0.0
+
+class Tenant:
+    def __init__(self, name: str, weight: float = 1.0,
+                 requests_per_min: float = DEFAULT_REQUESTS_PER_MIN,
+                 llm_tokens_per_min: float = DEFAULT_LLM_TOKENS_PER_MIN):
+        self.name = name
+        self.weight = max(0.01, float(weight))
+        self.requests = TokenBucket(requests_per_min)
+        self.llm_tokens = TokenBucket(llm_tokens_per_min)
+        self.usage = {"requests": 0, "degraded": 0, "llm_calls": 0, "llm_tokens": 0,
+                      "llm_over_quota": 0, "queue_wait_ms": 0}
+        self._lock = threading.Lock()
+
+    def count(self, key: str, n: int = 1):
+        with self._lock:
+            self.usage[key] += n
+
+    def take_request(self) -> bool:
+        self.count("requests")
+        return self.requests.take(1) or not QUOTAS_ENABLED
+
+    def take_llm(self, tokens: int) -> bool:
+        if self.llm_tokens.take(tokens) or not QUOTAS_ENABLED:
+            return True
+        self.count("llm_over_quota")
+        return False
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            usage = dict(self.usage)
+        return {
+            "tenant": self.name,
+            "weight": self.weight,
+            "usage": usage,
+            "remaining": {"requests": int(self.requests.level()), "llm_tokens": int(self.llm_tokens.level())},
+        }
+
+# ---------- Registry ----------
+_tenants: Dict[str, Tenant] = {}
+_keys: Dict[str, str] = {}      # api key -> tenant name
+_config: Dict[str, Dict] = {}
+_lock = threading.Lock()
+_loaded = False
+
+def _load_config():
+    global _loaded
+    _loaded = True
+    if not TENANTS_FILE:
+        return
+    with open(TENANTS_FILE, "r", encoding="utf-8") as f:
+        data = json.load(f) or {}
+    for name, cfg in (data.get("tenants") or {}).items():
+        _config[name] = cfg
+        for key in cfg.get("api_keys") or []:
+            _keys[key] = name
+
+def get_tenant(name: str) -> Tenant:
+    """Configured tenant ``name``; anything else is the default tenant."""
+    with _lock:
+        if not _loaded:
+            _load_config()
+        if name not in _config:
+            name = DEFAULT_TENANT
+        t = _tenants.get(name)
+        if t is None:
+            cfg = _config.get(name, {})
+            t = _tenants[name] = Tenant(
+                name,
+                weight=cfg.get("weight", 1.0),
+                requests_per_min=cfg.get("requests_per_min", DEFAULT_REQUESTS_PER_MIN),
+                llm_tokens_per_min=cfg.get("llm_tokens_per_min", DEFAULT_LLM_TOKENS_PER_MIN),
+            )
+        return t
+
+def resolve(api_key: Optional[str] = None, tenant_header: Optional[str] = None) -> Tenant:
+    """Tenant for a request's X-API-Key / X-Tenant headers."""
+    if api_key:
+        with _lock:
+            if not _loaded:
+                _load_config()
+            name = _keys.get(api_key)
+        return get_tenant(name or DEFAULT_TENANT)
+    if tenant_header and TRUST_TENANT_HEADER:
+        return get_tenant(NAME_RE.sub("", tenant_header)[:64])
+    return get_tenant(DEFAULT_TENANT)
+
+def all_usage():
+    with _lock:
+        tenants = list(_tenants.values())
+    return [t.snapshot() for t in tenants]
+
+# ---------- Weighted fair queue for LLM slots ----------
+class FairQueue:
+    """Hands out ``slots`` concurrent LLM calls across tenants by weighted fair
+    queueing: each call gets a virtual finish tag of ``cost / weight`` after its
+    tenant's previous tag, and the smallest tag goes next. A tenant with a
+    thousand queued clauses therefore interleaves with everyone else instead of
+    holding the provider until its batch is done."""
+
+    def __init__(self, slots: int):
+        self.slots = max(1, slots)
+        self.busy = 0
+        self._cond = threading.Condition()
+        self._heap = []                 # (finish tag, seq, start tag)
+        self._seq = itertools.count()
+        self._vtime = 0.0
+        self._last: Dict[str, float] = {}
+
+    def acquire(self, tenant: Tenant, cost: float, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            start = max(self._vtime, self._last.get(tenant.name, 0.0))
+            entry = (start + cost / tenant.weight, next(self._seq), start)
+            self._last[tenant.name] = entry[0]
+            heapq.heappush(self._heap, entry)
+            while self.busy >= self.slots or self._heap[0] is not entry:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    self._heap.remove(entry)
+                    heapq.heapify(self._heap)
+                    if self._last.get(tenant.name) == entry[0]:
+                        self._last[tenant.name] = start  # don't charge for work never done
+                    self._cond.notify_all()
+                    return False
+                self._cond.wait(left)
+            heapq.heappop(self._heap)
+            self.busy += 1
+            self._vtime = max(self._vtime, start)
+            self._cond.notify_all()
+            return True
+
+    def release(self):
+        with self._cond:
+            self.busy -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, tenant: Tenant, cost: float, timeout: float):
+        """Yields True once a slot is held, False if ``timeout`` passed first."""
+        t0 = time.monotonic()
+        ok = self.acquire(tenant, cost, timeout)
+        tenant.count("queue_wait_ms", int((time.monotonic() - t0) * 1000))
+        try:
+            yield ok
+        finally:
+            if ok:
+                self.release()
+
+_queue: Optional[FairQueue] = None
+
+def llm_queue() -> FairQueue:
+    """Process-wide queue sized to the provider's concurrency."""
+    global _queue
+    with _lock:
+        if _queue is None:
+            from llm import concurrency
+            _queue = FairQueue(concurrency())
+        return _queue
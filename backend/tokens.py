@@ -0,0 +1,90 @@
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+# ---------- Token counting ----------
+# tiktoken when installed (LLM_TOKENIZER, default cl100k_base: close enough to
+# the Llama 3 vocabulary for budgeting); otherwise a script-aware estimate.
+# Devanagari costs several times more tokens per character than Latin text,
+# so a character cap that is generous in English overflows in Hindi.
+TOKENIZER = os.getenv("LLM_TOKENIZER", "cl100k_base")
+
+LATIN_TOKENS_PER_CHAR = 0.25
+DEVANAGARI_TOKENS_PER_CHAR = 1.0
+OTHER_TOKENS_PER_CHAR = 0.5
+
+DEVANAGARI_RE = re.compile(r"[\u0900-\u097F]")
+NON_ASCII_RE = re.compile(r"[^\x00-\x7F]")
+SENTENCE_END_RE = re.compile(r"[.!?।](?:[\"')\]]*)(?=\s)")
+
+_encoding = None
+_encoding_loaded = False
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKENIZER)
+        except Exception:
+            _encoding = None  # not installed, or the BPE file can't be fetched offline
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    enc = _get_encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    dev = len(DEVANAGARI_RE.findall(text))
+    other = len(NON_ASCII_RE.findall(text)) - dev
+    latin = len(text) - dev - other
+    return int(latin * LATIN_TOKENS_PER_CHAR + dev * DEVANAGARI_TOKENS_PER_CHAR
+               + other * OTHER_TOKENS_PER_CHAR) + 1
+
+def chat_tokens(messages) -> int:
+    # ~4 tokens of chat framing per message, as in the OpenAI cookbook
+    return sum(count_tokens(m.get("content") or "") + 4 for m in messages) + 2
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of ``text`` within ``max_tokens`` that ends on a sentence
+    boundary; a single over-long first sentence is cut at a word instead."""
+    text = text or ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    ends = [m.end() for m in SENTENCE_END_RE.finditer(text)]
+    cut = _longest_fit(text, ends, max_tokens)
+    if cut:
+        return text[:cut].rstrip()
+    words = [m.start() for m in re.finditer(r"\s+", text)]
+    cut = _longest_fit(text, words, max_tokens - 1)
+    return text[:cut].rstrip() + " …" if cut else ""
+
+def _longest_fit(text: str, cuts, max_tokens: int) -> int:
+    # counts grow with the prefix, so binary-search the cut points
+    lo, hi, best = 0, len(cuts) - 1, 0
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if count_tokens(text[:cuts[mid]]) <= max_tokens:
+            best, lo = cuts[mid], mid + 1
+        else:
+            hi = mid - 1
+    return best
+
+# ---------- Cost ----------
+# USD per million (prompt, completion) tokens; LLM_PRICE_INPUT_PER_M /
+# LLM_PRICE_OUTPUT_PER_M override for any model (e.g. self-hosted = 0).
+PRICES_PER_M: Dict[str, Tuple[float, float]] = {
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+}
+
+def _price(model: Optional[str]) -> Tuple[float, float]:
+    base = PRICES_PER_M.get(model or "", (0.0, 0.0))
+    return (float(os.getenv("LLM_PRICE_INPUT_PER_M", base[0])),
+            float(os.getenv("LLM_PRICE_OUTPUT_PER_M", base[1])))
+
+def cost_usd(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> float:
+    inp, out = _price(model)
+    return round((prompt_tokens * inp + completion_tokens * out) / 1_000_000, 6)
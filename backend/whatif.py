@@ -0,0 +1,166 @@
+import argparse
+import json
+import sys
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from rules import WEIGHTS, SEVERE_FLAGS
+
+# ---------- What-if re-scoring ----------
+# Stored analyses are loaded once into a clause x rule hit-count matrix plus the
+# dampener vector. Any candidate weight vector (or a batch of them) is then
+# re-scored for the whole corpus with a handful of NumPy ops, mirroring
+# rules.score_signals and the 0.6/0.3/0.1 aggregation in analysis.py.
+
+TOP3 = np.array([0.6, 0.3, 0.1])
+BUCKETS = ["Low", "Medium", "High"]
+
+class ScoreMatrix:
+    def __init__(self, rules: List[str], hits: np.ndarray, dampen: np.ndarray, group: np.ndarray,
+                 contract_ids: np.ndarray, filenames: List[str]):
+        self.rules = rules                # column order of ``hits``
+        self.hits = hits                  # (clauses, rules) uint8 hit counts
+        self.dampen = dampen              # (clauses,) dampener totals
+        self.group = group                # (clauses,) row -> contract index
+        self.contract_ids = contract_ids  # (contracts,)
+        self.filenames = filenames
+        self.severe = np.array([r in SEVERE_FLAGS for r in rules])
+        # clauses with a severe flag escape the 6/10 soft cap whatever the weights
+        self.has_severe = (hits[:, self.severe] > 0).any(axis=1) if len(rules) else np.zeros(len(dampen), bool)
+
+    @property
+    def n_contracts(self) -> int:
+        return len(self.contract_ids)
+
+    def weight_matrix(self, candidates: Sequence[Dict[str, int]]) -> np.ndarray:
+        """(k, rules) weights: each candidate merged over the current rules/risks.json weights.
+        Raises ValueError naming any rule that is neither configured nor stored."""
+        known = set(WEIGHTS) | set(self.rules)
+        unknown = sorted({k for cand in candidates for k in (cand or {})} - known)
+        if unknown:
+            raise ValueError(f"unknown rules: {', '.join(unknown)}")
+        w = np.empty((len(candidates), len(self.rules)))
+        for i, cand in enumerate(candidates):
+            merged = {**WEIGHTS, **{k: int(v) for k, v in (cand or {}).items()}}
+            w[i] = [merged.get(r, 0) for r in self.rules]
+        return w
+
+    def clause_scores(self, weights: np.ndarray) -> np.ndarray:
+        """(clauses, k) scores for a (k, rules) weight matrix."""
+        raw = self.hits @ weights.T - self.dampen[:, None]
+        raw = np.maximum(raw, 0)
+        raw = np.where(self.has_severe[:, None], raw, np.minimum(raw, 6))
+        return np.clip(raw, 0, 10).astype(np.int64)
+
+    def overall_scores(self, scores: np.ndarray) -> np.ndarray:
+        """(contracts, k) weighted average of each contract's top-3 clause scores."""
+        n, k = scores.shape
+        out = np.zeros((self.n_contracts, k))
+        if n == 0:
+            return out.astype(np.int64)
+        # Sort rows by (contract, score desc); scores are 0..10 so one int key does it.
+        key = self.group[:, None] * 11 + (10 - scores)
+        order = np.argsort(key, axis=0, kind="stable")
+        g = self.group[order[:, 0]]       # identical for every column
+        rank = np.arange(n) - np.searchsorted(g, g, side="left")
+        top = rank < 3
+        vals = np.take_along_axis(scores, order, axis=0)[top] * TOP3[rank[top]][:, None]
+        for j in range(k):
+            out[:, j] = np.bincount(g[top], weights=vals[:, j], minlength=self.n_contracts)
+        return np.rint(out).astype(np.int64)
+
+def build_matrix(contracts, clauses, hits) -> ScoreMatrix:
+    cidx = {r[0]: i for i, r in enumerate(contracts)}
+    rows = {(r[0], r[1]): i for i, r in enumerate(clauses)}
+    rules = sorted(set(WEIGHTS) | {r[2] for r in hits})
+    col = {r: j for j, r in enumerate(rules)}
+
+    h = np.zeros((len(clauses), len(rules)), dtype=np.uint8)
+    for contract_id, clause_id, rule in hits:
+        i = rows.get((contract_id, clause_id))
+        if i is not None:
+            h[i, col[rule]] += 1
+    dampen = np.array([r[2] for r in clauses], dtype=np.int64)
+    group = np.array([cidx[r[0]] for r in clauses], dtype=np.int64)
+    return ScoreMatrix(
+        rules, h, dampen, group,
+        np.array([r[0] for r in contracts], dtype=np.int64),
+        [r[1] for r in contracts],
+    )
+
+_cache: Dict = {}
+_cache_lock = threading.Lock()
+
+def load_matrix(store) -> ScoreMatrix:
+    """Matrix for the store's live analyses, rebuilt only after the store changes."""
+    version = store.version()
+    with _cache_lock:
+        if _cache.get("version") != version or _cache.get("path") != store.path:
+            _cache.update(version=version, path=store.path, matrix=build_matrix(*store.scoring_rows()))
+        return _cache["matrix"]
+
+def _buckets(overall: np.ndarray) -> np.ndarray:
+    return np.digitize(overall, [4, 7])  # <=3 Low, <=6 Medium, else High (see analysis.bucketize)
+
+def _bucket_counts(overall: np.ndarray) -> Dict[str, int]:
+    counts = np.bincount(_buckets(overall), minlength=3)
+    return {name: int(n) for name, n in zip(BUCKETS, counts)}
+
+def compare(matrix: ScoreMatrix, candidates: List[Dict[str, int]], top: int = 20) -> Dict:
+    """Re-score the corpus under each candidate against the current weights."""
+    w = matrix.weight_matrix([{}] + list(candidates))
+    overall = matrix.overall_scores(matrix.clause_scores(w))
+    base = overall[:, 0]
+    base_b = _buckets(base)
+
+    results = []
+    for i, cand in enumerate(candidates, start=1):
+        new = overall[:, i]
+        delta = new - base
+        moves = np.bincount(base_b * 3 + _buckets(new), minlength=9).reshape(3, 3)
+        moved = {f"{BUCKETS[a]}->{BUCKETS[b]}": int(moves[a, b])
+                 for a in range(3) for b in range(3) if a != b and moves[a, b]}
+        biggest = np.argsort(-np.abs(delta), kind="stable")[:top]
+        results.append({
+            "weights": {r: int(x) for r, x in zip(matrix.rules, w[i])},
+            "mean_score": round(float(new.mean()), 3) if len(new) else 0.0,
+            "buckets": _bucket_counts(new),
+            "changed": int((delta != 0).sum()),
+            "bucket_moves": moved,
+            "top_changes": [
+                {"contract_id": int(matrix.contract_ids[j]), "filename": matrix.filenames[j],
+                 "before": int(base[j]), "after": int(new[j])}
+                for j in biggest if delta[j] != 0
+            ],
+        })
+    return {
+        "contracts": matrix.n_contracts,
+        "clauses": int(len(matrix.dampen)),
+        "baseline": {
+            "mean_score": round(float(base.mean()), 3) if len(base) else 0.0,
+            "buckets": _bucket_counts(base),
+        },
+        "candidates": results,
+    }
+
+# ---------- CLI ----------
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Re-score stored analyses under alternative rule weights.")
+    ap.add_argument("weights", nargs="+", help="JSON file(s) with rule -> weight overrides (risks.json format)")
+    ap.add_argument("--db", help="portfolio SQLite path (default: PORTFOLIO_DB or data/portfolio.db)")
+    ap.add_argument("--top", type=int, default=10, help="largest per-contract changes to list")
+    args = ap.parse_args(argv)
+
+    from portfolio import PortfolioStore, DB_PATH
+    candidates = []
+    for path in args.weights:
+        with open(path, "r", encoding="utf-8") as f:
+            candidates.append(json.load(f) or {})
+    matrix = load_matrix(PortfolioStore(args.db or DB_PATH))
+    json.dump(compare(matrix, candidates, top=args.top), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+if __name__ == "__main__":
+    main()
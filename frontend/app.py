@@ -1,9 +1,15 @@
+import hashlib
 import json
+import math
+import time
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import plotly.express as px
 import pandas as pd
 
+CLAUSES_PER_PAGE = 25
+
 # --- Page config ---
 st.set_page_config(
     page_title="⚖️ SME LegalSync",
@@ -111,6 +117,90 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# --- Backend I/O (pooled session, cached derived views) ---
+@st.cache_resource
+def http() -> requests.Session:
+    """One keep-alive connection pool shared by every rerun and session."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def result_key(res: dict) -> str:
+    return hashlib.sha1(json.dumps(res, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def risk_level(r):
+    if r == 0: return "Safe"
+    elif r <= 3: return "Low"
+    elif r <= 6: return "Medium"
+    return "High"
+
+# Leading-underscore args are not hashed by Streamlit; the result hash is the key.
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_charts(key: str, _res: dict):
+    clauses = _res.get("clauses", [])
+    df = pd.DataFrame([{"title": c["title"], "risk": c["risk"]} for c in clauses])
+    if df.empty:
+        return None, None
+    df["level"] = df["risk"].apply(risk_level)
+
+    pie = px.pie(df, names="level", title="Clause Risk Breakdown", color="level",
+                 color_discrete_map={"Safe":"green","Low":"lightgreen","Medium":"orange","High":"red"},
+                 hole=0.3)
+    pie.update_layout(title_x=0.5, margin=dict(t=50, b=20))
+
+    bar = None
+    top_risks = _res.get("top_risks", [])
+    if top_risks:
+        risk_df = pd.DataFrame(top_risks)
+        bar = px.bar(risk_df, x="title", y="score", color="score", title="Top Risky Clauses",
+                     color_continuous_scale="RdYlGn_r", text_auto=True)
+        bar.update_layout(title_x=0.5, xaxis_title="", yaxis_title="Risk Score", margin=dict(t=50, b=20))
+    return pie, bar
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def fetch_report(backend_url: str, kind: str, key: str, _res: dict) -> bytes:
+    """Fetch an export by analysis_id; re-upload the result only if the backend forgot it."""
+    path = "/report" if kind == "md" else "/report/pdf"
+    analysis_id = _res.get("analysis_id")
+    if analysis_id:
+        r = http().get(f"{backend_url}{path}", params={"analysis_id": analysis_id}, timeout=(5, 90))
+        if r.status_code != 404:
+            r.raise_for_status()
+            return r.content
+    r = http().post(f"{backend_url}{path}", json=_res, timeout=(5, 90))
+    r.raise_for_status()
+    return r.content
+
+def run_analysis(backend_url: str, files: dict, data: dict, read_timeout: float, on_clause) -> dict:
+    """Stream /analyze/stream, handing each scored clause to ``on_clause`` as it arrives."""
+    url = f"{backend_url}/analyze/stream"
+    with http().post(url, files=files, data=data, stream=True, timeout=(5, read_timeout)) as r:
+        if r.status_code == 404:
+            # older backend without streaming
+            r = http().post(f"{backend_url}/analyze", files=files, data=data, timeout=(5, read_timeout))
+            r.raise_for_status()
+            return r.json()
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if not line:
+                continue
+            ev = json.loads(line)
+            if ev["event"] == "clause":
+                on_clause(ev["clause"])
+            elif ev["event"] == "result":
+                return ev["result"]
+            elif ev["event"] == "error":
+                raise RuntimeError(ev.get("detail") or "analysis failed")
+    raise RuntimeError("analysis stream ended without a result")
+
+def set_result(res: dict):
+    st.session_state.analysis_result = res
+    st.session_state.result_key = result_key(res)
+    st.session_state.want_md = False
+    st.session_state.want_pdf = False
+
 # --- Sidebar controls ---
 st.sidebar.header("⚙️ Control Panel")
 backend = st.sidebar.text_input("Backend URL", "http://localhost:8000", help="Enter the backend API URL")
@@ -118,10 +208,12 @@ lang = st.sidebar.selectbox("Language", ["English", "Hindi"], index=0, help="Sel
 max_pages = st.sidebar.slider("Max Pages", 5, 30, 20, help="Maximum pages to analyze")
 time_budget = st.sidebar.slider("Analysis Time (sec)", 5, 30, 15, help="Time budget for analysis")
 use_llm = st.sidebar.checkbox("Enable AI Insights", value=True, help="Use LLM for deeper analysis")
+large_document = st.sidebar.checkbox("Large document mode", value=False,
+                                     help="Analyse every page (ignores Max Pages) for long agreements")
 
 if st.sidebar.button("🔗 Test Connection"):
     try:
-        r = requests.get(f"{backend}/health", timeout=10)
+        r = http().get(f"{backend}/health", timeout=10)
         r.raise_for_status()
         st.sidebar.success("✅ Backend Connected")
     except Exception as e:
@@ -133,7 +225,7 @@ tab1, tab2, tab3, tab4 = st.tabs(["📤 Upload Contract", "📊 Risk Dashboard",
 # --- Session state init ---
 if "analysis_result" not in st.session_state:
     st.session_state.analysis_result = None
-    st.session_state.report_pdf = None
+    st.session_state.result_key = None
 
 with tab1:
     st.header("📤 Upload Your Contract")
@@ -156,13 +248,31 @@ with tab1:
                     "max_pages": int(max_pages),
                     "time_budget_sec": int(time_budget),
                     "use_llm": bool(use_llm),
+                    "large_document": bool(large_document),
                 }
                 data = {"options": json.dumps(options)}
 
+                progress = st.empty()
+                seen = []
+                last_paint = [0.0]
+
+                def on_clause(c):
+                    seen.append(c)
+                    # repaint at most ~5x/s so long contracts don't flood the websocket
+                    if time.time() - last_paint[0] < 0.2:
+                        return
+                    last_paint[0] = time.time()
+                    with progress.container():
+                        st.caption(f"Scored {len(seen)} clauses so far…")
+                        st.dataframe(
+                            pd.DataFrame([{"Clause": x["title"], "Risk": x["risk"]} for x in seen[-10:]]),
+                            hide_index=True, use_container_width=True,
+                        )
+
                 with st.spinner("Analyzing your contract..."):
-                    r = requests.post(f"{backend}/analyze", files=files, data=data, timeout=180)
-                    r.raise_for_status()
-                    st.session_state.analysis_result = r.json()
+                    res = run_analysis(backend, files, data, read_timeout=int(time_budget) + 30, on_clause=on_clause)
+                    set_result(res)
+                progress.empty()
                 st.success("✅ Analysis Complete! View results in the Risk Dashboard.")
             except Exception as e:
                 st.error(f"❌ Analysis Failed: {e}")
@@ -177,33 +287,31 @@ with tab2:
         col1.metric("Risk Score", f"{res.get('overall_score',0)}/10", delta="Higher is riskier")
         col2.metric("Risk Level", res.get("bucket", "-"), delta_color="off")
         col3.metric("Analysis Time", f"{res.get('duration_ms',0)} ms")
+        usage = res.get("llm_usage") or {}
+        if usage.get("calls"):
+            st.caption(f"AI usage: {usage['calls']} calls, {usage['total_tokens']:,} tokens "
+                       f"(≈ ${usage.get('cost_usd', 0):.4f})")
+        skipped = (res.get("deadline") or {}).get("skipped") or {}
+        if skipped:
+            labels = {"pages": "pages", "entities": "entity tagging for clauses", "llm": "AI review for clauses"}
+            parts = [f"{labels.get(k, k)} ({'some' if n is None else n})" for k, n in skipped.items()]
+            st.info("⏱️ Time budget reached, skipped: " + ", ".join(parts) + ". Raise **Analysis Time** to cover more.")
+        coverage = res.get("coverage") or {}
+        if coverage.get("truncated") and "pages" not in skipped:
+            ratio = coverage.get("ratio")
+            share = f"{ratio:.0%} of" if ratio is not None else "part of"
+            st.warning(f"⚠️ Only {share} the document was analysed. Enable **Large document mode** to cover all pages.")
+        degraded = res.get("degraded")
+        if degraded:
+            st.warning(f"⚠️ AI review limited ({degraded.get('reason')}); heuristic scores shown. "
+                       f"Retry in ~{degraded.get('retry_after_sec', 0):.0f}s for full AI explanations.")
 
-        # --- Risk Distribution Pie ---
-        clauses = res.get("clauses", [])
-        df = pd.DataFrame([{"title": c["title"], "risk": c["risk"]} for c in clauses])
-
-        if not df.empty:
-            def risk_level(r):
-                if r == 0: return "Safe"
-                elif r <= 3: return "Low"
-                elif r <= 6: return "Medium"
-                return "High"
-            df["level"] = df["risk"].apply(risk_level)
-
-            pie = px.pie(df, names="level", title="Clause Risk Breakdown", color="level",
-                         color_discrete_map={"Safe":"green","Low":"lightgreen","Medium":"orange","High":"red"},
-                         hole=0.3)
-            pie.update_layout(title_x=0.5, margin=dict(t=50, b=20))
+        # --- Risk Distribution Pie / Top Risks Bar (memoised per result) ---
+        pie, bar = build_charts(st.session_state.result_key, res)
+        if pie is not None:
             st.plotly_chart(pie, use_container_width=True)
-
-            # --- Top Risks Bar ---
-            top_risks = res.get("top_risks", [])
-            if top_risks:
-                risk_df = pd.DataFrame(top_risks)
-                bar = px.bar(risk_df, x="title", y="score", color="score", title="Top Risky Clauses",
-                             color_continuous_scale="RdYlGn_r", text_auto=True)
-                bar.update_layout(title_x=0.5, xaxis_title="", yaxis_title="Risk Score", margin=dict(t=50, b=20))
-                st.plotly_chart(bar, use_container_width=True)
+        if bar is not None:
+            st.plotly_chart(bar, use_container_width=True)
 
 with tab3:
     st.header("📜 Clause Insights")
@@ -211,7 +319,12 @@ with tab3:
     if not res:
         st.info("No analysis available. Upload a contract to view clause details.")
     else:
-        for c in res["clauses"]:
+        clauses = res["clauses"]
+        flagged_only = st.toggle("Only flagged clauses", value=len(clauses) > CLAUSES_PER_PAGE)
+        shown = [c for c in clauses if c.get("risk", 0) > 0] if flagged_only else clauses
+        pages = max(1, math.ceil(len(shown) / CLAUSES_PER_PAGE))
+        page = st.number_input(f"Page (of {pages})", 1, pages, 1) if pages > 1 else 1
+        for c in shown[(page - 1) * CLAUSES_PER_PAGE: page * CLAUSES_PER_PAGE]:
             title = c.get("title","Clause")
             risk = c.get("risk",0)
 
@@ -231,12 +344,17 @@ with tab3:
                 if c.get("entities"):
                     st.caption("**Entities Detected:** " + ", ".join(c["entities"]))
                 if c.get("llm"):
-                    st.markdown("**AI Insights:**")
+                    if c["llm"].get("source") == "library":
+                        st.markdown(f"**Clause Library Suggestion** (`{c['llm'].get('library_id')}`):")
+                    else:
+                        st.markdown("**AI Insights:**")
                     if c["llm"].get("explanation"):
                         st.info(c["llm"]["explanation"])
                     if c["llm"].get("issue"):
                         st.warning(f"⚠️ {c['llm']['issue']}")
                     if c["llm"].get("alt_clause"):
+                        if c["llm"].get("library_id") and c["llm"].get("source") != "library":
+                            st.caption(f"Suggested wording from the clause library (`{c['llm']['library_id']}`)")
                         st.code(c["llm"]["alt_clause"], language="markdown")
 
 with tab4:
@@ -246,40 +364,40 @@ with tab4:
     if not res:
         st.info("Run an analysis in the **Upload Contract** tab to enable exports.")
     else:
+        key = st.session_state.result_key
+
         # Markdown Export
         with st.expander("📝 Markdown Report", expanded=True):
             if st.button("📥 Generate Markdown", use_container_width=True):
-                with st.spinner("Generating Markdown report..."):
-                    try:
-                        rr = requests.post(f"{backend}/report", json=res, timeout=60)
-                        rr.raise_for_status()
-                        st.download_button(
-                            "Download report.md",
-                            data=rr.text,
-                            file_name="contract_analysis.md",
-                            mime="text/markdown",
-                            use_container_width=True,
-                        )
-                    except Exception as e:
-                        st.error(f"❌ Could not generate report: {e}")
+                st.session_state.want_md = True
+            if st.session_state.get("want_md"):
+                try:
+                    with st.spinner("Generating Markdown report..."):
+                        md = fetch_report(backend, "md", key, res)
+                    st.download_button(
+                        "Download report.md",
+                        data=md,
+                        file_name="contract_analysis.md",
+                        mime="text/markdown",
+                        use_container_width=True,
+                    )
+                except Exception as e:
+                    st.error(f"❌ Could not generate report: {e}")
 
         # PDF Export
         with st.expander("📄 PDF Report", expanded=False):
             if st.button("📄 Generate PDF", use_container_width=True):
-                with st.spinner("Generating PDF report..."):
-                    try:
-                        rr = requests.post(f"{backend}/report/pdf", json=res, timeout=90)
-                        rr.raise_for_status()
-                        st.session_state.report_pdf = rr.content
-                        st.success("✅ PDF report generated. Download below.")
-                    except Exception as e:
-                        st.error(f"❌ Could not generate PDF: {e}")
-
-            if st.session_state.get("report_pdf"):
-                st.download_button(
-                    "📥 Download report.pdf",
-                    data=st.session_state.report_pdf,
-                    file_name="contract_analysis.pdf",
-                    mime="application/pdf",
-                    use_container_width=True
-                )
+                st.session_state.want_pdf = True
+            if st.session_state.get("want_pdf"):
+                try:
+                    with st.spinner("Generating PDF report..."):
+                        pdf = fetch_report(backend, "pdf", key, res)
+                    st.download_button(
+                        "📥 Download report.pdf",
+                        data=pdf,
+                        file_name="contract_analysis.pdf",
+                        mime="application/pdf",
+                        use_container_width=True
+                    )
+                except Exception as e:
+                    st.error(f"❌ Could not generate PDF: {e}")
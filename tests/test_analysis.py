@@ -0,0 +1,118 @@
+from backend import analysis
+
+CONTRACT = (
+    "Definitions\nAgreement means this services agreement between the parties.\n\n"
+    "Payment\nPayment of fees within 60 days of invoice.\n\n"
+    "Limitation of Liability\nThe Vendor shall have no liability for any loss.\n"
+)
+
+def test_llm_scheduled_by_risk_and_gated(monkeypatch):
+    calls = []
+    def fake_explain(clause_text, title, **kw):
+        calls.append(title)
+        return {"explanation": "ok", "issue": None, "alt_clause": None, "risk_0_10": 5}
+    monkeypatch.setattr(analysis, "explain_clause", fake_explain)
+    monkeypatch.setattr(analysis, "llm_concurrency", lambda: 1)  # call order is only defined with one worker
+
+    res = analysis.analyze_contract(CONTRACT, {"use_llm": True, "use_library": False, "llm_min_risk": 0})
+
+    assert calls == ["Limitation Of Liability", "Payment"]
+    assert [c["title"] for c in res["clauses"]] == ["Definitions", "Payment", "Limitation Of Liability"]
+    assert res["clauses"][0]["llm_skipped"] == "below_threshold"
+    assert res["llm_stats"] == {"called": 2, "gated": 1, "over_budget": 0, "over_quota": 0, "over_token_budget": 0}
+
+def test_offline_stub_provider():
+    from backend.providers import StubProvider
+    from backend import llm
+    note = llm.explain_clause("Vendor shall have no liability.", "Liability", provider=StubProvider(2))
+    again = llm.explain_clause("Vendor shall have no liability.", "Liability", provider=StubProvider(2))
+    assert note["explanation"] == "Offline stub review of the Liability clause."
+    assert note == again
+
+def test_cut_off_stream_is_partial():
+    from backend.providers import StubProvider
+    from backend import llm
+
+    class Truncated(StubProvider):
+        def _stream(self, messages, timeout, temperature, max_tokens):
+            yield '{"risk_0_10": 6, "explanation": "Liability is uncap'
+
+    note = llm.explain_clause("Vendor shall have no liability.", "Cut off", provider=Truncated(1, 0))
+    assert note["partial"] is True
+    assert note["explanation"] == "Liability is uncap" and note["risk_0_10"] == 6
+
+def test_token_budget_spent_on_riskiest_first(monkeypatch):
+    def fake_explain(clause_text, title, **kw):
+        return {"explanation": "ok", "usage": {"prompt_tokens": 300, "completion_tokens": 100,
+                                               "total_tokens": 400, "cost_usd": 0.0}}
+    monkeypatch.setattr(analysis, "explain_clause", fake_explain)
+    monkeypatch.setattr(analysis, "llm_concurrency", lambda: 1)
+
+    res = analysis.analyze_contract(CONTRACT, {"use_llm": True, "use_library": False, "max_llm_tokens": 1000})
+
+    skipped = {c["title"]: c.get("llm_skipped") for c in res["clauses"]}
+    assert skipped["Limitation Of Liability"] is None
+    assert skipped["Payment"] == "token_budget"
+    assert res["llm_usage"]["total_tokens"] == 400 and res["llm_usage"]["calls"] == 1
+
+def test_deadline_skips_optional_stages(monkeypatch):
+    from backend.deadline import Deadline
+    monkeypatch.setattr(analysis, "explain_clause", lambda **kw: {"explanation": "x"})
+    deadline = Deadline(2, reserve_sec=2)  # already in the reserve, < 3 s left for the LLM
+
+    res = analysis.analyze_contract(CONTRACT, {"use_llm": True, "use_library": False}, deadline=deadline)
+
+    assert [c["risk"] for c in res["clauses"]] == [c["risk"] for c in analysis.analyze_contract(CONTRACT, {})["clauses"]]
+    assert all(c["entities"] == [] for c in res["clauses"])
+    assert res["deadline"]["met"] and res["deadline"]["skipped"] == {"entities": 3, "llm": 3}
+
+def test_busy_provider_note_has_no_usage():
+    from backend.providers import StubProvider
+    from backend import llm
+    busy = StubProvider(1, 0)
+    busy._slots.acquire()
+    note = llm.explain_clause("Vendor shall have no liability.", "Busy", timeout_sec=0.1, provider=busy)
+    assert note["explanation"].startswith("⚠️ LLM error") and "usage" not in note
+
+def test_call_failing_before_output_is_not_billed(monkeypatch):
+    import functools
+    from backend.providers import StubProvider
+
+    class Refused(StubProvider):
+        def _stream(self, messages, timeout, temperature, max_tokens):
+            raise ConnectionError("connection refused")
+            yield
+
+    t = analysis.tenants.Tenant("acme")
+    monkeypatch.setattr(analysis, "explain_clause", functools.partial(analysis.explain_clause, provider=Refused(1, 0)))
+    res = analysis.analyze_contract(CONTRACT, {"use_llm": True, "use_library": False}, tenant=t)
+
+    assert res["clauses"][2]["llm"]["explanation"] == "⚠️ LLM error: connection refused"
+    assert res["llm_usage"]["calls"] == 0 and res["llm_usage"]["prompt_tokens"] == 0
+    assert t.snapshot()["usage"]["llm_calls"] == 0 and t.llm_tokens.tokens == t.llm_tokens.capacity
+
+def test_stream_timeout_counts_the_wait_for_a_slot():
+    import threading
+    from backend.providers import StubProvider
+    seen = []
+
+    class Recording(StubProvider):
+        def _stream(self, messages, timeout, temperature, max_tokens):
+            seen.append(timeout)
+            yield "{}"
+
+    p = Recording(1, 0)
+    p._slots.acquire()
+    threading.Timer(0.3, p._slots.release).start()
+    list(p.stream_chat([], timeout=1.0))
+    assert seen and seen[0] <= 0.75
+
+def test_library_match_still_reviewed_by_llm(monkeypatch):
+    monkeypatch.setattr(analysis, "explain_clause",
+                        lambda **kw: {"explanation": "llm", "issue": "i", "alt_clause": "llm wording", "risk_0_10": 7})
+    res = analysis.analyze_contract(
+        "Payment\nThe Client shall pay all invoices within 90 days of receipt.\n", {"use_llm": True})
+    note = res["clauses"][0]["llm"]
+    assert note["explanation"] == "llm" and note["risk_0_10"] == 7
+    assert note["library_id"].startswith("payment-") and note["alt_clause"] != "llm wording"
+    assert res["llm_stats"]["called"] == 1
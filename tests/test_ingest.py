@@ -0,0 +1,80 @@
+import zipfile
+from io import BytesIO
+
+from backend.ingest import _docx_text
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+def _p(text, num_id=None, ilvl=0):
+    ppr = f'<w:pPr><w:numPr><w:ilvl w:val="{ilvl}"/><w:numId w:val="{num_id}"/></w:numPr></w:pPr>' if num_id else ""
+    return f"<w:p>{ppr}<w:r><w:t>{text}</w:t></w:r></w:p>"
+
+def _docx(body, numbering=None, header=None, footer=None):
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("word/document.xml", f"<w:document {W}><w:body>{body}</w:body></w:document>")
+        if numbering:
+            zf.writestr("word/numbering.xml", f"<w:numbering {W}>{numbering}</w:numbering>")
+        if header:
+            zf.writestr("word/header1.xml", f"<w:hdr {W}>{_p(header)}</w:hdr>")
+        if footer:
+            zf.writestr("word/footer1.xml", f"<w:ftr {W}>{_p(footer)}</w:ftr>")
+    return buf.getvalue()
+
+NUMBERING = (
+    '<w:abstractNum w:abstractNumId="0">'
+    '<w:lvl w:ilvl="0"><w:start w:val="1"/><w:numFmt w:val="decimal"/><w:lvlText w:val="%1."/></w:lvl>'
+    '<w:lvl w:ilvl="1"><w:start w:val="1"/><w:numFmt w:val="lowerLetter"/><w:lvlText w:val="(%2)"/></w:lvl>'
+    '</w:abstractNum><w:num w:numId="1"><w:abstractNumId w:val="0"/></w:num>'
+)
+
+def test_docx_numbering_tables_and_headers():
+    body = (
+        _p("Payment", 1) + _p("Net 60 days.", 1, 1) + _p("Late fee applies.", 1, 1)
+        + "<w:tbl><w:tr><w:tc>" + _p("Fees") + "</w:tc><w:tc>" + _p("INR 5,00,000") + "</w:tc></w:tr></w:tbl>"
+        + _p("Indemnity", 1)
+    )
+    text = _docx_text(_docx(body, NUMBERING, header="ACME SERVICES AGREEMENT"))
+    assert text.splitlines() == [
+        "ACME SERVICES AGREEMENT",
+        "1. Payment",
+        "(a) Net 60 days.",
+        "(b) Late fee applies.",
+        "Fees | INR 5,00,000",
+        "2. Indemnity",
+    ]
+
+def test_docx_footer_stays_out_of_last_clause():
+    from backend.rules import detect_clauses
+    body = _p("Payment") + _p("Net 30 days.") + _p("Governing Law") + _p("Laws of India.")
+    text = _docx_text(_docx(body, header="ACME", footer="Page 1 | Confidential draft"))
+    assert text.splitlines()[:2] == ["ACME", "Page 1 | Confidential draft"]
+    assert detect_clauses(text)[-1].text == "Laws of India."
+
+def test_docx_stops_at_max_chars():
+    body = "".join(_p(f"Paragraph {i} " + "x" * 50) for i in range(1000))
+    text = _docx_text(_docx(body), max_chars=500)
+    assert 500 <= len(text) < 600
+
+def test_coverage_reports_truncation(monkeypatch):
+    from backend import ingest
+    raw = ("Payment\n" + "x" * 91 + "\n") * 10  # 100 chars a line
+    cov = {}
+    text, _ = ingest.extract_bytes(raw.encode(), "a.txt", max_chars=500, coverage=cov)
+    assert len(text) == 500 and cov["truncated"] and cov["ratio"] == 0.5
+
+    monkeypatch.setattr(ingest, "PSEUDO_PAGE_CHARS", 300)
+    cov = {}
+    pages = list(ingest.iter_pages(raw.encode(), "a.txt", cov))
+    assert "".join(pages) == raw and all(len(p) <= 300 for p in pages)
+    assert cov["pages_analyzed"] == len(pages) and cov["ratio"] == 1.0
+
+def test_iter_pages_stops_at_deadline(monkeypatch):
+    from backend import ingest
+    from backend.deadline import Deadline
+    monkeypatch.setattr(ingest, "PSEUDO_PAGE_CHARS", 300)
+    raw = ("Payment\n" + "x" * 91 + "\n") * 10
+    cov, deadline = {}, Deadline(10, reserve_sec=10)  # already in the reserve
+    pages = list(ingest.iter_pages(raw.encode(), "a.txt", cov, deadline))
+    assert len(pages) == 1 and cov["truncated"]
+    assert deadline.skipped == {"pages": None}  # slice count of a text stream isn't known up front
@@ -0,0 +1,21 @@
+from backend.jsonstream import IncrementalJSON
+
+DOC = '```json\n{"explanation": "Pays \\"late\\" \\u0924\\u0915", "issue": null, "alt_clause": "Net 30.", "risk_0_10": 7}\n```'
+
+def test_fields_complete_across_chunks():
+    p = IncrementalJSON()
+    for i in range(0, len(DOC), 3):
+        p.feed(DOC[i:i + 3])
+    assert p.done
+    assert p.fields == {"explanation": 'Pays "late" तक', "issue": None, "alt_clause": "Net 30.", "risk_0_10": 7}
+
+def test_partial_string_and_trailing_scalar():
+    p = IncrementalJSON()
+    assert p.feed('{"risk_0_10": 4, "explanation": "Payment is sl') == [("risk_0_10", 4)]
+    assert p.partial == ("explanation", "Payment is sl")
+    assert p.snapshot()["explanation"] == "Payment is sl"
+
+    p = IncrementalJSON()
+    p.feed('{"issue": "x", "risk_0_10": 9')
+    assert "risk_0_10" not in p.fields
+    assert p.finish() == [("risk_0_10", 9)]
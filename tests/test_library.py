@@ -0,0 +1,21 @@
+from backend.library import suggest_alternative
+
+def test_library_match_for_flagged_clause():
+    note = suggest_alternative(
+        "Payment",
+        "The Client shall pay all invoices within 90 days of receipt.",
+        ["payment_terms_gt_45d", "no_late_fee"],
+    )
+    assert note is not None
+    assert note["source"] == "library"
+    assert note["library_id"].startswith("payment-")
+    assert note["alt_clause"]
+
+def test_library_skips_unflagged_and_unmatched():
+    assert suggest_alternative("Payment", "Net 30 days.", []) is None
+    # no Hindi entries ship yet, so Hindi falls through to the LLM
+    assert suggest_alternative("भुगतान", "भुगतान 90 दिनों में", ["payment_terms_gt_45d"], lang="Hindi") is None
+
+def test_rule_and_heading_match_alone_do_not_clear_the_threshold():
+    assert suggest_alternative("Payment", "zzz qqq", ["no_late_fee"]) is None
+    assert suggest_alternative("Indemnity", "The office is repainted every spring.", ["unilateral_indemnity"]) is None
@@ -0,0 +1,43 @@
+from backend.portfolio import PortfolioStore
+
+def _result(score, hits):
+    return {"overall_score": score, "bucket": "High" if score > 6 else "Low",
+            "clauses": [{"id": "c1", "title": "Liability", "risk": score, "rule_hits": hits,
+                         "entities": ["Acme Pvt Ltd (ORG)"]}]}
+
+def test_filter_aggregate_and_compact():
+    st = PortfolioStore(":memory:")
+    st.append(_result(9, ["unlimited_liability", "foreign_forum"]), "h1", "a.pdf",
+              {"status": "active", "category": "vendor", "contract_date": "2025-03-01"})
+    st.append(_result(4, ["unlimited_liability"]), "h2", "b.pdf", {"status": "active", "category": "vendor"})
+    st.append(_result(2, []), "h2", "b.pdf", {"status": "active", "category": "vendor"})  # re-analysis
+
+    hit = st.contracts(rules=["unlimited_liability", "foreign_forum"], status="active", category="vendor")
+    assert hit["total"] == 1
+    assert hit["items"][0]["counterparty"] == "Acme Pvt Ltd"
+    assert st.contracts(rules=["never_seen"])["total"] == 0
+    assert st.contracts(min_score=0)["total"] == 2  # superseded row hidden
+
+    by_rule = {r["key"]: r["contracts"] for r in st.stats("rule")}
+    assert by_rule == {"unlimited_liability": 1, "foreign_forum": 1}
+
+    assert st.compact() == {"removed": 1, "contracts": 2}
+
+def test_template_reused_across_counterparties():
+    st = PortfolioStore(":memory:")
+    st.append(_result(5, []), "nda", "nda.pdf", {"counterparty": "Acme"})
+    st.append(_result(5, []), "nda", "nda.pdf", {"counterparty": "Globex"})
+    st.append(_result(6, []), "v1", "msa.pdf", {"document_id": "MSA-7"})
+    st.append(_result(3, []), "v2", "msa.pdf", {"document_id": "MSA-7"})  # revised text, same contract
+
+    assert st.contracts()["total"] == 3
+    assert st.compact() == {"removed": 1, "contracts": 3}
+
+def test_content_hash_same_for_whole_text_and_pages():
+    from backend.ingest import PAGE_MARK
+    from backend.portfolio import ContentHasher, content_hash
+    pages = ["1. Payment\nNet 60 days.\n", "2. Indemnity\nVendor indemnifies the Client."]
+    h = ContentHasher()
+    for page in pages:
+        h.update(page)
+    assert h.hexdigest() == content_hash(PAGE_MARK.join(pages).strip())
@@ -0,0 +1,41 @@
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from backend import profiling
+
+def test_stage_is_noop_without_profile():
+    with profiling.stage("detect_clauses"):
+        pass
+    assert profiling.current() is None
+
+def test_profiled_request_is_stored(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+
+    def wait():
+        with profiling.stage("llm_wait"):
+            pass
+
+    with profiling.profiled(True, "/analyze", {"filename": "a.pdf"}) as prof:
+        with profiling.stage("extract_text"):
+            sum(range(1000))
+        with ThreadPoolExecutor(2) as pool:
+            for f in [pool.submit(contextvars.copy_context().run, wait) for _ in range(3)]:
+                f.result()
+
+    with open(profiling.path_for(prof.id), encoding="utf-8") as f:
+        summary = json.load(f)
+    assert summary["filename"] == "a.pdf"
+    assert summary["stages"]["extract_text"]["calls"] == 1
+    assert summary["stages"]["llm_wait"]["calls"] == 3
+    assert profiling.path_for(prof.id, "pstats")
+    assert profiling.path_for("../etc/passwd") is None
+
+def test_profiling_is_gated(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING", False)
+    monkeypatch.setattr(profiling, "PROFILE_ADMIN_TOKEN", "")
+    assert not profiling.requested({"profile": True}) and not profiling.authorized()
+
+    monkeypatch.setattr(profiling, "PROFILE_ADMIN_TOKEN", "s3cret")
+    assert profiling.requested({}, "s3cret") and not profiling.requested({"profile": True})
+    assert profiling.authorized("s3cret") and not profiling.authorized("guess")
@@ -11,3 +11,26 @@ def test_apply_rules():
     score, hits = apply_rules(cl)
     assert score >= 2
     assert "payment_terms_gt_45d" in hits
+
+def test_iter_clauses_carries_across_pages():
+    from backend.rules import iter_clauses
+    pages = [
+        "Cover page\n1. Payment\nNet 60 days",
+        "from invoice. No late fee.\n2. Indemnity\nVendor indemnifies",
+        "the Client without limit.\n",
+    ]
+    cs = list(iter_clauses(pages))
+    assert [c.title for c in cs] == ["Payment", "Indemnity"]
+    assert "from invoice" in cs[0].text and "without limit" in cs[1].text
+    assert [(c.title, c.text) for c in cs] == [(c.title, c.text) for c in detect_clauses("\n".join(pages))]
+
+def test_iter_clauses_falls_back_to_loose_headings():
+    from backend.rules import iter_clauses, PREAMBLE_LIMIT
+    # headings run into the text instead of starting a line
+    clause = " ".join(f"{h}: the parties agree as follows. " + "x " * 200
+                      for h in ["Payment", "Indemnity", "Termination", "Confidentiality"])
+    pages = [f"Page {i}. {clause}\n" for i in range(20)]
+    assert sum(map(len, pages)) > PREAMBLE_LIMIT
+    cs = list(iter_clauses(pages))
+    assert len(cs) == 80
+    assert [c.title for c in cs] == [c.title for c in detect_clauses("".join(pages))]
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.singleflight import AsyncSingleFlight, EventLog, SingleFlight
+
+def test_followers_share_result_and_failure():
+    sf = SingleFlight()
+    calls, results, errors = [], [], []
+    gate = threading.Event()
+
+    def work():
+        calls.append(1)
+        gate.wait()
+        if len(calls) == 1:
+            raise ValueError("boom")
+        return "ok"
+
+    def caller():
+        try:
+            results.append(sf.do("k", work, timeout=5))
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=caller) for _ in range(3)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    gate.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and len(errors) == 3
+    assert sf.in_flight() == 0
+    assert sf.do("k", work) == ("ok", False)  # a failed flight is not cached
+
+def test_async_waiter_cancel_does_not_cancel_others():
+    async def main():
+        sf = AsyncSingleFlight()
+        runs = []
+
+        async def work():
+            runs.append(1)
+            await asyncio.sleep(0.05)
+            return {"score": 7}
+
+        first = asyncio.ensure_future(sf.do("k", work))
+        second = asyncio.ensure_future(sf.do("k", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == ({"score": 7}, True)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert runs == [1] and sf.in_flight() == 0
+
+    asyncio.run(main())
+
+def test_event_log_replays_for_late_readers():
+    log = EventLog()
+    log.append(1)
+    log.append(2)
+    late = log.follow()
+    assert next(late) == 1
+    log.append(3)
+    log.close()
+    assert list(late) == [2, 3]
+
+def test_joined_clause_review_is_admitted_once():
+    from contextlib import contextmanager
+    from backend import llm
+    from backend.providers import StubProvider
+
+    admitted = []
+
+    @contextmanager
+    def admit():
+        admitted.append(1)
+        yield 5
+
+    provider = StubProvider(4, latency_ms=100)
+    notes = []
+    threads = [threading.Thread(target=lambda: notes.append(llm.explain_clause(
+        "Vendor shall indemnify without limit.", "Indemnity", provider=provider, admit=admit)))
+        for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(admitted) == 1
+    assert sum(1 for n in notes if n["usage"].get("coalesced")) == 2
@@ -0,0 +1,14 @@
+from backend import tokens
+
+def test_truncate_keeps_sentence_boundaries():
+    text = "The Vendor shall pay. The Client shall indemnify the Vendor! Notice is 30 days. " * 5
+    cut = tokens.truncate_tokens(text, 30)
+    assert cut.endswith((".", "!")) and text.startswith(cut)
+    assert tokens.count_tokens(cut) <= 30
+    assert tokens.truncate_tokens("short text", 30) == "short text"
+
+def test_hindi_costs_more_per_char():
+    en, hi = "Payment is due within thirty days", "भुगतान तीस दिनों के भीतर देय है"
+    assert tokens.count_tokens(hi) / len(hi) > tokens.count_tokens(en) / len(en)
+    cut = tokens.truncate_tokens("विक्रेता भुगतान करेगा। ग्राहक क्षतिपूर्ति करेगा। " * 3, 30)
+    assert cut.endswith("।")
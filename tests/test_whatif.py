@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+from backend.rules import score_signals, WEIGHTS
+from backend.whatif import build_matrix, compare
+
+def _reference_overall(clause_scores):
+    s = sorted(clause_scores, reverse=True) + [0, 0, 0]
+    return int(round(0.6 * s[0] + 0.3 * s[1] + 0.1 * s[2]))
+
+def test_vectorised_scores_match_scalar_scoring():
+    rng = random.Random(7)
+    rules = sorted(WEIGHTS)
+    contracts, clauses, hits, expected = [], [], [], {}
+    cand = {r: rng.randint(0, 8) for r in rules}
+    for cid in range(1, 60):
+        contracts.append((cid, f"c{cid}.pdf", 0))
+        per_contract = []
+        for k in range(rng.randint(0, 6)):
+            h = rng.sample(rules, rng.randint(0, 3))
+            if h and rng.random() < 0.2:
+                h.append(h[0])  # duplicate hits count twice, as in apply_rules
+            d = rng.choice([0, 0, 1, 2, 4])
+            clauses.append((cid, f"c{k}", d))
+            hits += [(cid, f"c{k}", r) for r in h]
+            per_contract.append(score_signals(h, d, {**WEIGHTS, **cand}))
+        expected[cid] = _reference_overall(per_contract)
+
+    m = build_matrix(contracts, clauses, hits)
+    overall = m.overall_scores(m.clause_scores(m.weight_matrix([cand])))[:, 0]
+    assert overall.tolist() == [expected[c[0]] for c in contracts]
+
+    res = compare(m, [cand, {}])
+    assert res["contracts"] == 59
+    assert res["candidates"][1]["changed"] == 0
+    assert sum(res["candidates"][0]["buckets"].values()) == 59
+
+    with pytest.raises(ValueError, match="unknown rules: unlimted_liability"):
+        compare(m, [{"unlimted_liability": 9}])